@@ -22,35 +22,392 @@
 # 所以只需要考虑左方，左上方，上方，右上方的像素即可
 
 
+# 皮肤区域的划分使用两遍扫描的连通区域标记算法（见 RegionLabeler）
+# 第一遍逐行扫描，把每一行中连续的肤色像素看作一个行程（run），与上一行相邻的行程用并查集合并
+# 第二遍把并查集的根映射为连续的区域号，整个过程的耗时与像素数成线性关系
+
+
 # ######################实现脚本#######################
 
 # 导入所需要的模块
 import sys
 import os
+import io
+import json
+import time
+import hashlib
+import inspect
+import functools
+import mmap
+import sqlite3
+import tempfile
+from array import array
 from collections import namedtuple
 from PIL import Image
 
+# numpy 为可选依赖：安装后可以整幅图像一次性向量化地完成肤色判定，否则退回逐像素判定
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# 连通区域标记器
+class RegionLabeler(object):
+    """
+    基于行程和并查集（路径压缩）的两遍扫描连通区域标记
+    逐行调用 feed() 送入该行肤色像素的行程，最后调用 resolve() 得到最终区域号和区域大小
+    connectivity 为 8 时左上、右上方向的像素也视为相邻，为 4 时只考虑上下左右
+    keep_runs 为 False 时不保存行程，并定期把已经结束的区域移出并查集，内存不随图像高度增长；
+    此时像素数不大于 min_size 的区域只计数，不保留
+    track_closed 为 True 时逐行统计已经结束的区域，供提前得出判定结果使用
+    """
+
+    def __init__(self, connectivity=8, keep_runs=True, min_size=0, track_closed=False):
+        if connectivity not in (4, 8):
+            raise ValueError("connectivity must be 4 or 8, not {}".format(connectivity))
+        self.connectivity = connectivity
+        # 并查集的父节点，元素索引为临时区域号
+        self.parent = []
+        # 临时区域的像素数，合并后累计到根节点上
+        self.sizes = []
+        # 临时区域的外接矩形 [left, upper, right, lower]（right、lower 不包含），合并后累计到根节点上
+        self.boxes = []
+        # 所有行程，每 4 个整数 y, start, end, 临时区域号 为一个行程，end 不包含在行程内
+        # 使用紧凑的 array 而不是元组列表，内存只与行程数的字节数相关
+        self.runs = array("i")
+        self.keep_runs = keep_runs
+        self.min_size = min_size
+        # 已经结束（不再与后续行相邻）的区域的像素数和外接矩形，只在 keep_runs 为 False 时使用
+        self.closed_sizes = array("i")
+        self.closed_boxes = array("i")
+        # 已经结束且像素数不大于 min_size 的区域数
+        self.dropped = 0
+        # 已送入的肤色像素总数
+        self.skin_pixels = 0
+        # 共发现的临时区域数和实际发生的合并次数
+        self.created = 0
+        self.merges = 0
+        self.track_closed = track_closed
+        # 以下统计只在 track_closed 为 True 时更新
+        # 已经结束且像素数大于 min_size 的区域数、像素总数和其中最大区域的像素数，这些区域不会再变化
+        self.closed_count = 0
+        self.closed_total = 0
+        self.closed_max = 0
+        # 与最近一行相邻、仍可能继续增长或合并的区域的像素总数
+        self.open_total = 0
+        # 并查集中的临时区域数达到该值时整理一次
+        self._compact_at = 4096
+        # 上一行的行程 (start, end, 临时区域号)
+        self._prev_runs = []
+        # 已送入的行数
+        self.rows = 0
+
+    def _find(self, label):
+        parent = self.parent
+        root = label
+        while parent[root] != root:
+            root = parent[root]
+        # 路径压缩：把路径上的节点直接挂到根节点下
+        while parent[label] != root:
+            parent[label], label = root, parent[label]
+        return root
+
+    def _union(self, a, b):
+        a, b = self._find(a), self._find(b)
+        if a == b:
+            return a
+        # 总是以较早发现的区域作为根，保证区域号按发现顺序排列
+        if b < a:
+            a, b = b, a
+        self.parent[b] = a
+        self.merges += 1
+        self.sizes[a] += self.sizes[b]
+        box_a, box_b = self.boxes[a], self.boxes[b]
+        box_a[0] = min(box_a[0], box_b[0])
+        box_a[1] = min(box_a[1], box_b[1])
+        box_a[2] = max(box_a[2], box_b[2])
+        box_a[3] = max(box_a[3], box_b[3])
+        return a
+
+    def feed(self, runs):
+        """
+        送入下一行的肤色行程 [(start, end), ...]，行程需按 start 升序排列
+        """
+        # 8 连通时，上一行的行程只要与当前行程在横向上相接（差 1 个像素）也算相邻
+        touch = 1 if self.connectivity == 8 else 0
+        prev = self._prev_runs
+        current = []
+        j = 0
+        for start, end in runs:
+            # 跳过上一行中完全位于当前行程左侧的行程
+            while j < len(prev) and prev[j][1] + touch <= start:
+                j += 1
+            label = -1
+            k = j
+            # 与当前行程相邻的上一行行程都属于同一个区域
+            while k < len(prev) and prev[k][0] < end + touch:
+                if label == -1:
+                    label = self._find(prev[k][2])
+                else:
+                    label = self._union(label, prev[k][2])
+                k += 1
+            # 上一行没有相邻行程，发现了新的皮肤区域
+            if label == -1:
+                label = len(self.parent)
+                self.created += 1
+                self.parent.append(label)
+                self.sizes.append(0)
+                self.boxes.append([start, self.rows, end, self.rows + 1])
+            self.sizes[label] += end - start
+            box = self.boxes[label]
+            if start < box[0]:
+                box[0] = start
+            if end > box[2]:
+                box[2] = end
+            box[3] = self.rows + 1
+            current.append((start, end, label))
+            if self.keep_runs:
+                self.runs.extend((self.rows, start, end, label))
+            self.skin_pixels += end - start
+        if self.track_closed:
+            self._track(prev, current)
+        self._prev_runs = current
+        self.rows += 1
+        if not self.keep_runs and len(self.parent) >= self._compact_at:
+            self.compact()
+
+    def _track(self, prev, current):
+        # 上一行的区域若不与当前行任何行程相连（合并后的根不在当前行中），则已经结束
+        roots = set(self._find(label) for start, end, label in current)
+        for root in set(self._find(label) for start, end, label in prev):
+            if root not in roots:
+                size = self.sizes[root]
+                if size > self.min_size:
+                    self.closed_count += 1
+                    self.closed_total += size
+                    self.closed_max = max(self.closed_max, size)
+        self.open_total = sum(self.sizes[root] for root in roots)
+
+    def compact(self):
+        """
+        把不再与最近一行相邻的区域移出并查集，只保留其像素数和外接矩形
+        整理后临时区域号会重新分配，因此只能在不保存行程时使用
+        """
+        if self.keep_runs:
+            raise RuntimeError("compact() cannot be used while keeping runs")
+        live = {}
+        parent, sizes, boxes, prev = [], [], [], []
+        for start, end, label in self._prev_runs:
+            root = self._find(label)
+            if root not in live:
+                live[root] = len(parent)
+                parent.append(len(parent))
+                sizes.append(self.sizes[root])
+                boxes.append(self.boxes[root])
+            prev.append((start, end, live[root]))
+        for label in range(len(self.parent)):
+            if self.parent[label] == label and label not in live:
+                self._close(self.sizes[label], self.boxes[label])
+        self.parent, self.sizes, self.boxes, self._prev_runs = parent, sizes, boxes, prev
+        # 整理的代价与临时区域数成正比，下次整理的阈值随之翻倍，总耗时仍为线性
+        self._compact_at = max(4096, 2 * len(parent))
+
+    def _close(self, size, box):
+        if size > self.min_size:
+            self.closed_sizes.append(size)
+            self.closed_boxes.extend(box)
+        else:
+            self.dropped += 1
+
+    def resolve(self):
+        """
+        第二遍扫描：返回 (mapping, sizes, boxes)
+        mapping[临时区域号] 为最终区域号，sizes[最终区域号] 为该区域的像素数，
+        boxes[最终区域号] 为该区域的外接矩形 (left, upper, right, lower)
+        """
+        mapping = []
+        # 先放入已经移出并查集的区域
+        sizes = list(self.closed_sizes)
+        boxes = [tuple(self.closed_boxes[i:i + 4]) for i in range(0, len(self.closed_boxes), 4)]
+        for label in range(len(self.parent)):
+            root = self._find(label)
+            if root == label:
+                mapping.append(len(sizes))
+                if not self.keep_runs and self.sizes[label] <= self.min_size:
+                    self.dropped += 1
+                    continue
+                sizes.append(self.sizes[label])
+                boxes.append(tuple(self.boxes[label]))
+            else:
+                # 根节点的区域号总是小于其子节点，因此已经分配过
+                mapping.append(mapping[root])
+        return mapping, sizes, boxes
+
+    def fill(self, mapping, labels, width):
+        """
+        按行程把最终区域号写入扁平的区域号数组 labels（长度为 width * 行数，非肤色像素应预先置为 -1）
+        """
+        runs = self.runs
+        for i in range(0, len(runs), 4):
+            offset = runs[i] * width
+            start, end, label = runs[i + 1], runs[i + 2], mapping[runs[i + 3]]
+            if np is not None and isinstance(labels, np.ndarray):
+                labels[offset + start:offset + end] = label
+            else:
+                labels[offset + start:offset + end] = array("i", [label]) * (end - start)
+
+
+# 皮肤像素图
+class SkinMap(object):
+    """
+    每个像素区域号的只读视图，底层是扁平的 int32 区域号数组（非肤色像素为 -1）
+    按索引访问时才临时生成对应像素的 Skin 对象，用法与原来的 Skin 对象列表相同
+    """
+
+    def __init__(self, labels, width):
+        self.labels = labels
+        self.width = width
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("skin map index out of range")
+        region = int(self.labels[index])
+        return Nude.Skin(index + 1, region >= 0, region if region >= 0 else None,
+                         index % self.width, index // self.width)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def at(self, x, y):
+        """返回坐标 (x, y) 处像素的 Skin 对象"""
+        return self[x + y * self.width]
+
 
 # 设计 Nude 类
+# 判定阈值：清理皮肤区域的像素数、最少区域数、最低皮肤比例（%）、最大区域的最低占比（%）、最多区域数
+Thresholds = namedtuple("Thresholds", "min_region_size min_regions skin_percent largest_percent max_regions")
+
+
+def judge(count, total_skin, largest, total_pixels, thresholds):
+    """
+    由保留下来的皮肤区域个数、总像素数和最大区域的像素数得出判定结果
+    返回 (result, decided_by, message)，只需要 O(1) 时间
+    """
+    t = thresholds
+    # 如果皮肤区域过少，不是色情
+    if count < t.min_regions:
+        return False, "few_regions", "Less than {:g} skin regions ({})".format(t.min_regions, count)
+    # 如果皮肤区域与整个图像的比值过小，不是色情图片
+    percent = total_skin / total_pixels * 100
+    if percent < t.skin_percent:
+        return False, "skin_percentage", "Total skin percentage lower than {:g}({:.2f})".format(
+            t.skin_percent, percent)
+    # 如果最大皮肤区域占总皮肤面积的比例过小，不是色情图片
+    percent = largest / total_skin * 100 if total_skin else 0
+    if percent < t.largest_percent:
+        return False, "largest_region", "The biggest region contains less than {:g} ({:.2f})".format(
+            t.largest_percent, percent)
+    # 如果皮肤区域过多，不是色情图片
+    if count > t.max_regions:
+        return False, "many_regions", "More than {:g} skin regions ({})".format(t.max_regions, count)
+    # 其他情况为色情图片
+    return True, "nude", "Nude!!"
+
+
+def evaluate_summary(summary, thresholds=None):
+    """
+    按给定的阈值重新判定 Nude.region_summary() 得到的汇总，无需重新解析图像，只需要 O(区域数) 时间
+    返回值与 judge() 相同
+    """
+    t = thresholds or Nude.THRESHOLDS
+    if t.min_region_size < summary["floor"]:
+        raise ValueError("The summary only keeps regions larger than {}, cannot evaluate "
+                         "min_region_size {}".format(summary["floor"], t.min_region_size))
+    # sizes 从大到小排列，保留的区域是其中的前 count 个
+    sizes = summary["sizes"]
+    count = 0
+    for size in sizes:
+        if size <= t.min_region_size:
+            break
+        count += 1
+    return judge(count, float(sum(sizes[:count])), sizes[0] if count else 0,
+                 summary["total_pixels"], t)
+
+
 class Nude(object):
     # 定义 Skin 类，这里使用nanmetuple()方法，即命名元组：
     # collections.namedtuple(typename, field_names)：typename：此元组的名称；field_names: 元祖中元素的名称
     Skin = namedtuple("Skin", "id skin region x y")
 
+    # 可供组合的四种肤色判定规则，默认只使用 YCbCr 规则
+    CLASSIFIERS = ("rgb", "norm_rgb", "hsv", "ycbcr")
+
+    # 向量化判定时每个条带的行数
+    BAND_HEIGHT = 256
+
+    # 默认的判定阈值
+    THRESHOLDS = Thresholds(min_region_size=30, min_regions=3, skin_percent=15, largest_percent=45,
+                            max_regions=60)
+
+    # 像素数不大于该值的皮肤区域会被清理掉
+    MIN_REGION_SIZE = THRESHOLDS.min_region_size
+
     # 初始化 Nude 类
-    def __init__(self, path_or_image):
+    # classifiers 为要组合的判定规则名称，任意一条规则成立即视为肤色像素
+    # connectivity 为划分皮肤区域时使用的 4 连通或 8 连通
+    # lookup_table 为 True 时使用预先计算好的肤色查找表（不存在时自动生成），每个像素只需查一次表
+    # instrument 为 True 时记录各阶段的耗时和计数到 self.stats；on_stats 为 parse() 完成后接收 stats 的回调函数
+    # thresholds 为 Thresholds 判定阈值，默认为 THRESHOLDS
+    def __init__(self, path_or_image, classifiers=("ycbcr",), connectivity=8, lookup_table=False,
+                 instrument=False, on_stats=None, thresholds=None):
+        # 各阶段的墙钟时间和 CPU 时间以及各项计数，未开启时为 None，开销可以忽略
+        self.stats = {"phases": {}, "counters": {}} if instrument or on_stats else None
+        self.on_stats = on_stats
+        start = self._clock() if self.stats is not None else None
+        for name in classifiers:
+            if name not in self.CLASSIFIERS:
+                raise ValueError("Unknown skin classifier: {}".format(name))
+        if not classifiers:
+            raise ValueError("At least one skin classifier is required")
+        self.classifiers = tuple(classifiers)
+        if connectivity not in (4, 8):
+            raise ValueError("connectivity must be 4 or 8, not {}".format(connectivity))
+        self.connectivity = connectivity
+        self.thresholds = thresholds or self.THRESHOLDS
+        # 肤色查找表，见 load_skin_table()
+        self.skin_table = load_skin_table(self.classifiers) if lookup_table else None
         # 当path_or_image为Image.Image类型时，直接可以赋值
         if isinstance(path_or_image, Image.Image):
             self.image = path_or_image
         # 若path_or_image为str类型的实例（指路径），打开图片
         elif isinstance(path_or_image, str):
             self.image = Image.open(path_or_image)
+        # 也可以是已打开的二进制文件对象，例如包含图像数据的 io.BytesIO
+        elif hasattr(path_or_image, "read"):
+            self.image = Image.open(path_or_image)
+        else:
+            raise TypeError("Expected an image, a path or a file object, not {}".format(
+                type(path_or_image).__name__))
+
+        # 记录源文件路径，内存中创建的图像没有 filename 属性，此时为空字符串
+        self.filename = getattr(self.image, "filename", "")
 
         # 获取图片所有颜色通道
         # getbands()函数能够返回一个元组，包含每一个band的名字，比如在在一副RGB图像上使用，返回('R','G', 'B')
         bands = self.image.getbands()
         # 判断是否为灰度图，若是，则将灰度图转换为RGB图
-        if len(bands) == 1:
+        # CMYK、LA、YCbCr 等其他模式同样先转换为RGB图，这样逐像素判定和向量化判定读取的是相同的 R、G、B 值；
+        # RGBA、RGBX 的前三个通道就是 R、G、B，不需要转换
+        if len(bands) == 1 or self.image.mode not in ("RGB", "RGBA", "RGBX"):
             # 新建大小相同的RGB图像
             new_img = Image.new("RGB", self.image.size)
             # 拷贝灰度图 self.image 到 RGB 图的 new_img.paste （PIL将自动完成颜色通道转换）
@@ -58,179 +415,423 @@ class Nude(object):
             # 上，右和下像素坐标的4元组，或者为空（与（0， 0）效果一样）。注意：当使用4元组时，被粘贴的图像尺寸
             # 必须与区域尺寸一样；两者模式不一致时，被粘贴的图像将被转换为当前图像的模式
             new_img.paste(self.image)
-            f = self.image.filename
             # 替换 self.image
             self.image = new_img
-            self.image.filename = f
 
-        # 创建list用于存储对应图像所有像素的全部 Skin 对象
+        # 解析后为 SkinMap 对象，可以像列表一样按索引得到每个像素的 Skin 对象
         self.skin_map = []
-        # 对于检测到的皮肤区域，元素的索引即为皮肤区域号，元素都是包含一些 Skin 对象的列表
-        self.detected_regions = []
-        # 对于待合并区域的元素
-        self.merge_regions = []
-        # 对于合并整合后的皮肤区域，元素的索引即为皮肤区域号，元素都是包含一些 Skin 对象的列表
+        # 每个像素的皮肤区域号组成的扁平数组，非肤色像素为 -1
+        self.labels = None
+        # 连通区域标记得到的各个皮肤区域的像素数，元素的索引即为皮肤区域号
+        self.region_sizes = []
+        # 各个皮肤区域的外接矩形 (left, upper, right, lower)
+        self.region_boxes = []
+        # 清理后保留下来的皮肤区域的像素数
         self.skin_regions = []
-        # 将最近合并的两个皮肤区域的区域号初始化为-1
-        self.last_from, self.last_to = -1, -1
+        # 清理后保留下来的皮肤区域号
+        self.skin_labels = set()
         # 色情图片判断结果
         self.result = None
         # 处理得到的信息
         self.message = None
+        # 得出结果所依据的规则：few_regions、skin_percentage、largest_region、many_regions 或 nude
+        self.decided_by = None
+        # 提前得出结果时已经扫描的行数，扫描完整幅图像时为 None
+        self.stopped_row = None
+        # 像素数不大于该值的皮肤区域会被清理掉，金字塔中缩小的图像会按面积比例调小
+        self.min_region_size = self.thresholds.min_region_size
+        # parse_pyramid() 得出结果时图像的缩小倍数，1 表示原图
+        self.pyramid_level = None
         # 图像宽高
         self.width, self.height = self.image.size
         # 图像总像素
         self.total_pixels = self.width * self.height
+        # resize() 中解码和重采样的耗时（秒）以及解码器缩小后的尺寸
+        self.resize_info = {}
+        if start is not None:
+            self._record("open", start)
+
+    # 计时：返回 (墙钟时间, CPU 时间)
+    @staticmethod
+    def _clock():
+        return time.perf_counter(), time.process_time()
+
+    # 把从 start 到现在的耗时累加到 phase 阶段，返回当前时间以便接着计时
+    def _record(self, phase, start):
+        now = self._clock()
+        timing = self.stats["phases"].setdefault(phase, {"wall": 0.0, "cpu": 0.0})
+        timing["wall"] += now[0] - start[0]
+        timing["cpu"] += now[1] - start[1]
+        return now
 
     # 由于图片越大，耗费的资源越大，所以有时候需要对图片进行缩小
-    def resize(self, maxwidth=1000, maxheight=1000):
+    def resize(self, maxwidth=1000, maxheight=1000, resample=Image.LANCZOS, draft=False):
         """
         基于最大宽高按比例重新设置图片大小
         如果没有变化 返回 0
         原宽度大于 maxwidth 返回 1
         原高度大于 maxheight 返回 2
         原宽高各大于 maxwidth maxheight 返回 3
+        resample 为重采样滤波器，可以选择比 Image.LANCZOS 更快的滤波器
+        draft 为 True 时先让解码器按缩小的比例解码（JPEG 的 DCT 缩放），只适用于尚未加载的图像
         """
         # 存储返回值
         ret = 0
+        # 先算出最终尺寸，再一次性重采样，而不是宽和高各重采样一次
+        width, height = self.width, self.height
         if maxwidth:
-            if self.width > maxwidth:
-                wpercent = (maxwidth / self.width)
-                hsize = int((self.height * wpercent))
-                fname = self.image.filename
-                # Image.LANCZOS 是重采样滤波器，用于抗锯齿
-                self.image = self.image.resize((maxwidth, hsize), Image.LANCZOS)
-                self.image.filename = fname
-                self.width, self.height = self.image.size
-                self.total_pixels = self.width * self.height
+            if width > maxwidth:
+                wpercent = (maxwidth / width)
+                width, height = maxwidth, int((height * wpercent))
                 ret += 1
         if maxheight:
-            if self.height > maxheight:
-                hpercent = (maxheight / float(self.height))
-                wsize = int((float(self.width) * float(hpercent)))
-                fname = self.image.filename
-                self.image = self.image.resize((wsize, maxheight), Image.LANCZOS)
-                self.filename = fname
-                self.width, self.height = self.image.size
-                self.total_pixels = self.width * self.height
+            if height > maxheight:
+                hpercent = (maxheight / float(height))
+                width, height = int((float(width) * float(hpercent))), maxheight
                 ret += 2
+        if not ret:
+            return ret
+
+        clock = self._clock() if self.stats is not None else None
+        start = time.perf_counter()
+        # draft() 只会把图像缩小到不小于请求的尺寸，之后仍需重采样到准确的尺寸
+        if draft and self.image.draft(self.image.mode, (width, height)) is not None:
+            self.resize_info["draft"] = self.image.size
+        self.image.load()
+        decoded = time.perf_counter()
+        # Image.LANCZOS 是重采样滤波器，用于抗锯齿
+        self.image = self.image.resize((width, height), resample)
+        self.resize_info["decode"] = decoded - start
+        self.resize_info["resample"] = time.perf_counter() - decoded
+        self.width, self.height = self.image.size
+        self.total_pixels = self.width * self.height
+        if clock is not None:
+            self._record("resize", clock)
         return ret
 
     # 关键解析方法
-    def parse(self):
+    def parse(self, streaming=False, early_exit=False):
+        """
+        划分皮肤区域并得出判定结果
+        streaming 为 True 时按条带判定，只保留上一行的行程和各区域的计数，不生成 labels 和 skin_map，
+        适合不缩小就直接检测的超大图像；此时 region_sizes 中只包含未被清理的皮肤区域
+        early_exit 为 True 时一旦结果已经确定就停止扫描，此时 stopped_row 为已扫描的行数，
+        region_sizes、labels 等只包含已扫描部分的数据；result 与完整解析相同，
+        但 decided_by 和 message 说明的是提前确定结果的那条规则，可能与完整解析时最先成立的规则不同
+        """
         # 如果已有结果，则返回本对象
         if self.result is not None:
             return self
-        # 不然获得图像所有像素数据
+        timed = self.stats is not None
+        start = self._clock() if timed else None
+        # load（）方法能为图像分配内存并从文件中加载它，已经加载过时直接返回
+        self.image.load()
+        if timed:
+            start = self._record("decode", start)
+        # 第一遍扫描：逐行得到肤色像素的行程，并与上一行相邻的行程合并为同一区域
+        labeler = RegionLabeler(self.connectivity, keep_runs=not streaming,
+                                min_size=self.min_region_size, track_closed=early_exit)
+        rows = iter(self._skin_runs())
+        while True:
+            runs = next(rows, None)
+            if runs is None:
+                break
+            if timed:
+                start = self._record("classify", start)
+            labeler.feed(runs)
+            if timed:
+                start = self._record("label", start)
+            if early_exit and self._decide_early(labeler):
+                break
+        # 第二遍扫描：得到最终的区域号和各区域的像素数
+        mapping, self.region_sizes, self.region_boxes = labeler.resolve()
+
+        if streaming:
+            if timed:
+                self._record("resolve", start)
+            return self._finish(labeler)
+
+        # 把每个像素的区域号写入扁平数组，每个像素只占 4 个字节
+        # 不再为每个像素创建 Skin 对象，而是通过 SkinMap 按需生成
+        if np is not None:
+            self.labels = np.full(self.total_pixels, -1, dtype=np.int32)
+        else:
+            self.labels = array("i", [-1]) * self.total_pixels
+        labeler.fill(mapping, self.labels, self.width)
+        self.skin_map = SkinMap(self.labels, self.width)
+        if timed:
+            self._record("resolve", start)
+        return self._finish(labeler)
+
+    # 由粗到细的金字塔解析
+    def parse_pyramid(self, factors=(8, 4, 2), margin=0.25, streaming=False, early_exit=False):
+        """
+        先在缩小 factors[0] 倍的图像上解析，只有各项比例接近判定阈值时才换到更大的图像，最后才解析原图
+        缩小 f 倍时清理皮肤区域的像素数阈值同样缩小 f * f 倍
+        margin 为判定阈值附近的相对范围：皮肤比例或最大区域比例在阈值 * (1 ± margin) 之内，
+        或区域个数与最少、最多区域数相差不超过 max(1, 阈值 * margin) 时视为不确定
+        得出结果的缩小倍数保存在 pyramid_level 中，streaming 和 early_exit 只用于解析原图
+        在缩小的图像上得出结果时，region_sizes 和 skin_regions 是按面积比例换算到原图的近似值
+        """
+        if self.result is not None:
+            return self
+        for factor in factors:
+            # 缩小后的图像太小时已经没有参考价值
+            if factor <= 1 or min(self.width, self.height) // factor < 8:
+                continue
+            start = self._clock() if self.stats is not None else None
+            level = Nude(self.image.reduce(factor), classifiers=self.classifiers,
+                         connectivity=self.connectivity, thresholds=self.thresholds,
+                         instrument=self.stats is not None)
+            level.skin_table = self.skin_table
+            level.min_region_size = self.min_region_size / float(factor * factor)
+            level.parse()
+            if start is not None:
+                self._record("pyramid_{}".format(factor), start)
+            if self._certain(level, margin):
+                self.result, self.message, self.decided_by = level.result, level.message, level.decided_by
+                # 区域的像素数按面积比例换算到原图，与 total_pixels 一致
+                scale = self.total_pixels / float(level.total_pixels)
+                self.region_sizes = [int(round(size * scale)) for size in level.region_sizes]
+                self.skin_regions = [int(round(size * scale)) for size in level.skin_regions]
+                self.pyramid_level = factor
+                if self.stats is not None:
+                    # 计数来自得出结果的缩小图像
+                    self.stats["counters"].update(level.stats["counters"])
+                    if self.on_stats is not None:
+                        self.on_stats(self.stats)
+                return self
+        self.pyramid_level = 1
+        return self.parse(streaming=streaming, early_exit=early_exit)
+
+    # 判断解析结果是否远离各个判定阈值，即图像稍有变化时结果也不会改变
+    def _certain(self, level, margin):
+        count = len(level.skin_regions)
+        total_skin = float(sum(level.skin_regions))
+        percent = total_skin / level.total_pixels * 100
+        largest = max(level.skin_regions) / total_skin * 100 if total_skin else 0
+        t = self.thresholds
+        few, many = max(1, t.min_regions * margin), max(1, t.max_regions * margin)
+        # 任意一条规则确定成立时结果确定为“不是色情图片”
+        if count < t.min_regions - few or percent < t.skin_percent * (1 - margin) or\
+                largest < t.largest_percent * (1 - margin) or count > t.max_regions + many:
+            return True
+        # 所有规则都确定不成立时结果确定为“色情图片”
+        return count >= t.min_regions + few and percent >= t.skin_percent * (1 + margin) and\
+            largest >= t.largest_percent * (1 + margin) and count <= t.max_regions - many
+
+    # 清理、分析皮肤区域，并汇总统计数据
+    def _finish(self, labeler):
+        start = self._clock() if self.stats is not None else None
+        # 清理像素数过少的皮肤区域
+        self._clear_regions(self.region_sizes)
+        # 分析皮肤区域，得到判定结果
+        if self.result is None:
+            self._analyse_regions()
+        if start is None:
+            return self
+        self._record("analyse", start)
+        self.stats["counters"].update({
+            "pixels_classified": labeler.rows * self.width,
+            "skin_pixels": labeler.skin_pixels,
+            "raw_regions": labeler.created,
+            "merges": labeler.merges,
+            "regions": len(self.region_sizes) + labeler.dropped,
+            "final_regions": len(self.skin_regions),
+        })
+        if self.on_stats is not None:
+            self.on_stats(self.stats)
+        return self
+
+    # 根据已扫描部分的统计判断结果是否已经确定
+    # 四条规则都只会得出“不是色情图片”，只要能确定其中任意一条最终必然成立，结果就已经确定
+    def _decide_early(self, labeler):
+        t = self.thresholds
+        remaining = (self.height - labeler.rows) * self.width
+        message = None
+        # 即使剩余像素全是肤色，皮肤比例也达不到阈值
+        percent = (labeler.skin_pixels + remaining) / self.total_pixels * 100
+        if percent < t.skin_percent:
+            self.decided_by = "skin_percentage"
+            message = "Total skin percentage lower than {:g} (at most {:.2f})".format(
+                t.skin_percent, percent)
+        # 已经结束的区域不会再合并，数量超过最多区域数时皮肤区域数一定超过最多区域数
+        elif labeler.closed_count > t.max_regions:
+            self.decided_by = "many_regions"
+            message = "More than {:g} skin regions (at least {})".format(
+                t.max_regions, labeler.closed_count)
+        # 最大区域要么是已经结束的区域，要么由仍在增长的区域和剩余像素构成，分别估计其占比的上限
+        elif labeler.closed_total:
+            grow = labeler.open_total + remaining
+            percent = max(labeler.closed_max / labeler.closed_total,
+                          grow / (labeler.closed_total + grow)) * 100
+            if percent < t.largest_percent:
+                self.decided_by = "largest_region"
+                message = "The biggest region contains less than {:g} (at most {:.2f})".format(
+                    t.largest_percent, percent)
+        if message is None:
+            return False
+        self.message = message
+        self.result = False
+        self.stopped_row = labeler.rows
+        return True
+
+    # 逐行生成肤色像素的行程 [(start, end), ...]
+    def _skin_runs(self):
+        if np is not None:
+            # 按水平条带取出像素并计算肤色掩码，数组和浮点临时数组的大小都与条带而不是整幅图像成正比
+            for top in range(0, self.height, self.BAND_HEIGHT):
+                band = self.image.crop((0, top, self.width, min(top + self.BAND_HEIGHT, self.height)))
+                mask = self._skin_mask(self._rgb_array(band))
+                for runs in self._mask_runs(mask):
+                    yield runs
+            return
+
+        # 没有 numpy 时逐像素判定
         # load（）方法能为图像分配内存并从文件中加载它，能返回一个用于读取和修改像素的像素访问对象，这个对象
         # 是一个二维队列
         pixels = self.image.load()
-
-        # 接下来，遍历所有像素，为每个像素创建 Skin 对象
         for y in range(self.height):
+            runs = []
+            start = None
             for x in range(self.width):
                 # 得到像素的RGB三个通道值
                 # [x, y] 是[(x, y)]的简便写法
                 r = pixels[x, y][0]     # 获取red
                 g = pixels[x, y][1]     # 获取green
                 b = pixels[x, y][2]     # 获取blue
-
                 # 判断当前像素是否为肤色像素
-                isSkin = True if self._classify_skin(r, g, b) else False
-                # 给每个像素分配唯一的 id 值，（1， 2, 3， height * width）
-                # 注意x， y的值从零开始的
-                _id = x + y * self.width + 1
-                # 为每个像素创建 Skin 对象，并添加到 self.skin_map 中
-                self.skin_map.append(self.Skin(_id, isSkin, None, x, y))
-
-                # 若当前像素并不是肤色，则跳过本次循环，继续遍历
-                if not isSkin:
-                    continue
-                # 若当前像素是肤色像素，则需要进行处理，先遍历其相邻元素
-                # 需要注意相邻像素的索引值，像素的 id 是从1开始的，但索引是从0开始的。所以当前像素在
-                # self.skin_map中的索引值为 _id - 1 ,以此类推，左方像素为 _id - 1 -1
-                # 左上方为 _id - 1 - self.width - 1,上方为 _id - 1 - self.width, 右上方为
-                # _id - 1 - self.width + 1
-
-                check_indexes = [_id - 2, _id - self.width -2, _id - self.width - 1, _id - self.width]
-                # 分别检查四个相邻元素是否为肤色像素
-
-                # 用来记录相邻像素中肤色像素所在的区域号，初始化为 -1
-                region = -1
-                # 遍历每一个相邻像素的索引
-                for index in check_indexes:
-                    # 尝试索引相邻像素的 Skin 对象，没有则跳出循环
-                    try:
-                        self.skin_map[index]
-                    except IndexError:
-                        break
-                    # 相邻元素若为肤色像素
-                    if self.skin_map[index].skin:
-                        # 若相邻像素与当前像素的 region 均为有效值，且两者不同，且尚未添加相同的合并任务
-                        if (self.skin_map[index].region is not None and
-                                region is not None and region != -1 and
-                                self.skin_map[index].region != region and
-                                self.last_from != region and
-                                self.last_to != self.skin_map[index].region):
-                            # 那么添加这两个区域的合并任务
-                            self._add_merge(region, self.skin_map[index].region)
-                        region = self.skin_map[index].region
-                        # self._add_merge()这个方法接收两个区域号，将其放入到self.merge_regions中
-                        # self.merge_regions的每一个元素都是一个列表，这些列表中有多个区域号
-                        # 表示这些区域号是相互连通的，需要合并
-
-                # 遍历完所有相邻像素后，分两种情况处理
-                # 1.所有相邻像素都不是肤像素：发现了新的皮肤区域
-                # 2.存在区域号为有效值的相邻肤色像素：region存储的值把当前像素归到这个相邻像素所在的区域
-
-                # 遍历完所有相邻像素后，若 region 仍等于 -1，说明所有相邻元素都不是肤色像素
-                if region == -1:
-                    # 更改属性为新的区域号，由于元组是不可变类型的，不能直接更改属性
-                    # somenametuple._replace(kwargs)返回一个替换指定字段为参数的实例
-                    _skin = self.skin_map[_id - 1]._replace(region=len(self.detected_regions))
-                    self.skin_map[_id - 1] = _skin
-                    # 将此肤色像素所在区域创建为新区域
-                    self.detected_regions.append([self.skin_map[_id - 1]])
-
-                    # region不等于 -1 且不等于 None， 说明有相邻像素为有效肤色像素
-                elif region is not None:
-                    # 将此像素的区域号改为与相邻像素相同
-                    _skin = self.skin_map[_id - 1]._replace(region=region)
-                    self.skin_map[_id - 1] = _skin
-                    # 向这个区域的像素列表中添加此元素
-                    self.detected_regions[region].append(self.skin_map[_id - 1])
-
-        # 此时已经遍历所有元素，图片的皮肤区域初步划分完成，只是在self.merge_regions中还有一些连通的
-        # 皮肤区域号，需要合并
-        # 将完成合并的区域存储到 self.skin_regions
-        self._merge(self.detected_regions, self.merge_regions)
-        # 分析皮肤区域，得到判定结果
-        self._analyse_regions()
-        return self
-
-        # 方法self._merge()是用来合并连通区域
-        # 方法self._analyse_regions(),用来对图片进行判定
+                if self._classify_skin(r, g, b):
+                    if start is None:
+                        start = x
+                elif start is not None:
+                    runs.append((start, x))
+                    start = None
+            if start is not None:
+                runs.append((start, self.width))
+            yield runs
 
 # 接下来，写出在之前程序中调用但没有写过的方法
 # 基于像素的肤色检测技术
 
     def _classify_skin(self, r, g, b):
-        # 根据RGB值判定
-        rgb_classifier = r > 95 and g > 40 and g < 100 and b > 20 and max([r, g, b])\
-                        - min([r, g, b]) > 15 and abs(r - g) > 15 and r > g and r > b
-        # 根据处理后的RGB值判定
+        # 有查找表时直接查表，第 (r << 16 | g << 8 | b) 位即为判定结果
+        if self.skin_table is not None:
+            index = r << 16 | g << 8 | b
+            return self.skin_table[index >> 3] >> (index & 7) & 1 == 1
+        # 依次使用选定的判定规则，任意一条成立即为肤色
+        # 默认只使用 YCbCr 规则，即原来的 return ycbcr_classifier
+        for name in self.classifiers:
+            if getattr(self, "_{}_classifier".format(name))(r, g, b):
+                return True
+        return False
+
+    # 根据RGB值判定
+    def _rgb_classifier(self, r, g, b):
+        return r > 95 and g > 40 and g < 100 and b > 20 and max([r, g, b])\
+            - min([r, g, b]) > 15 and abs(r - g) > 15 and r > g and r > b
+
+    # 根据处理后的RGB值判定
+    def _norm_rgb_classifier(self, r, g, b):
         nr, ng, nb = self._to_normalized(r, g, b)
-        norm_rgb_classifier = nr / ng > 1.185 and float(r * b) / ((r + g + b) ** 2) > 0.107 and\
-                             float(r * g) / ((r + g + b) ** 2) > 0.112
-        # HSV颜色模式下的判定
+        return nr / ng > 1.185 and float(r * b) / ((r + g + b) ** 2) > 0.107 and\
+            float(r * g) / ((r + g + b) ** 2) > 0.112
+
+    # HSV颜色模式下的判定
+    def _hsv_classifier(self, r, g, b):
         h, s, v = self._to_hsv(r, g, b)
-        hsv_classifier = h > 0 and h < 35 and s > 0.23 and s < 0.68
-        # YCbCr颜色模式下的判定
+        return h > 0 and h < 35 and s > 0.23 and s < 0.68
+
+    # YCbCr颜色模式下的判定
+    def _ycbcr_classifier(self, r, g, b):
         y, cb, cr = self._to_ycbcr(r, g, b)
-        ycbcr_classifier = 97.5 <= cb <= 142.5 and 134 <= cr <= 176
+        return 97.5 <= cb <= 142.5 and 134 <= cr <= 176
+
+    # 把若干行的肤色掩码转换为逐行的行程列表
+    def _mask_runs(self, mask):
+        height, width = mask.shape
+        # 左右各补一列非肤色像素，肤色与非肤色交替的位置即为行程的起止点
+        padded = np.zeros((height, width + 2), dtype=bool)
+        padded[:, 1:-1] = mask
+        edges = np.flatnonzero(padded[:, 1:] != padded[:, :-1])
+        rows, cols = np.divmod(edges, width + 1)
+        # 每个行程对应一对起止点，按行拆分
+        bounds = np.searchsorted(rows[::2], np.arange(height + 1)).tolist()
+        starts, ends = cols[::2], cols[1::2]
+        for y in range(height):
+            yield list(zip(starts[bounds[y]:bounds[y + 1]].tolist(),
+                           ends[bounds[y]:bounds[y + 1]].tolist()))
 
-        # 此处可以return rgb_classifier or norm_rgb_classifier or hsv_classifier or ycbcr_classifier
-        return ycbcr_classifier
+    # 整幅图像的向量化肤色判定
+    # 与 _classify_skin 使用完全相同的公式和运算顺序，因此逐像素结果与之完全一致
+    def skin_mask(self, classifiers=None):
+        """
+        返回形状为 (height, width) 的布尔数组，True 表示肤色像素
+        classifiers 缺省时使用创建对象时选定的判定规则
+        需要安装 numpy
+        """
+        if np is None:
+            raise RuntimeError("skin_mask() requires numpy")
+        return self._skin_mask(self._rgb_array(), classifiers)
+
+    # 将图像转换为 (height, width, 3) 的数组，只转换一次
+    def _rgb_array(self, image=None):
+        image = self.image if image is None else image
+        # 与逐像素判定一样只取前三个通道，其余模式交给 PIL 转换
+        if image.mode in ("RGB", "RGBA", "RGBX"):
+            return np.asarray(image)[:, :, :3]
+        return np.asarray(image.convert("RGB"))
+
+    def _skin_mask(self, rgb, classifiers=None):
+        if classifiers is None and self.skin_table is not None:
+            index = (rgb[..., 0].astype(np.uint32) << 16) | (rgb[..., 1].astype(np.uint32) << 8) |\
+                rgb[..., 2]
+            return (self.skin_table[index >> 3] >> (index & 7).astype(np.uint8)) & 1 == 1
+        classifiers = self.classifiers if classifiers is None else classifiers
+        # 使用 float64 计算，保证与 Python 浮点运算逐位相同
+        r, g, b = (rgb[..., i].astype(np.float64) for i in range(3))
+        mask = np.zeros(r.shape, dtype=bool)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for name in classifiers:
+                if name not in self.CLASSIFIERS:
+                    raise ValueError("Unknown skin classifier: {}".format(name))
+                mask |= getattr(self, "_{}_mask".format(name))(r, g, b)
+        return mask
+
+    def _rgb_mask(self, r, g, b):
+        _max = np.maximum(np.maximum(r, g), b)
+        _min = np.minimum(np.minimum(r, g), b)
+        return ((r > 95) & (g > 40) & (g < 100) & (b > 20) & (_max - _min > 15) &
+                (np.abs(r - g) > 15) & (r > g) & (r > b))
+
+    def _norm_rgb_mask(self, r, g, b):
+        # 对应 _to_normalized 中把 0 替换成 0.0001 的处理
+        nr, ng, nb = (np.where(c == 0, 0.0001, c) for c in (r, g, b))
+        _sum = nr + ng + nb
+        square = (r + g + b) ** 2
+        return ((nr / _sum) / (ng / _sum) > 1.185) & (r * b / square > 0.107) &\
+            (r * g / square > 0.112)
+
+    def _hsv_mask(self, r, g, b):
+        # 对应 _to_hsv 中的分支：最大值为 r、g、b 时分别计算色相
+        _max = np.maximum(np.maximum(r, g), b)
+        _min = np.minimum(np.minimum(r, g), b)
+        diff = _max - _min
+        _sum = r + g + b
+        _sum = np.where(_sum == 0, 0.0001, _sum)
+        h = np.where(_max == r, (g - b) / diff,
+                     np.where(_max == g, 2 + ((g - r) / diff), 4 + ((r - g) / diff)))
+        # 灰色像素的色相为 sys.maxsize，一定不在肤色范围内
+        h[(_max == r) & (diff == 0)] = np.inf
+        h *= 60
+        h = np.where(h < 0, h + 360, h)
+        s = 1.0 - (3.0 * (_min / _sum))
+        return (h > 0) & (h < 35) & (s > 0.23) & (s < 0.68)
+
+    def _ycbcr_mask(self, r, g, b):
+        cb = 128 - 0.168736 * r - 0.331364 * g + 0.5 * b
+        cr = 128 + 0.5 * r - 0.418688 * g - 0.081312 * b
+        return (97.5 <= cb) & (cb <= 142.5) & (134 <= cr) & (cr <= 176)
 
     # 颜色模式的转换不是重点，网上有很多，直接荡
     def _to_normalized(self, r, g, b):
@@ -249,173 +850,144 @@ class Nude(object):
         cr = 128 + 0.5 * r - 0.418688 * g - 0.081312 * b
         return y, cb, cr
 
-    # 接下来完成self._add_merge()方法
-    # 主要是对self.merge_regions操作，而self.merge_regions的元素都是包含一些int对象的列表
-    # 列表中的区域号代表的区域都待合并的区域
-    # self._add_merge()接收两个区域号，将之添加到self.merge_regions中
-
-    # 这两个区域号如何处理，分为3种情况
-    # 1.传入的两个区域号都在self.merge_regions中
-    # 2.传入的两个区域号中一个在self.merge_regions中
-    # 3.传入的两个区域号都不在self.merge_regions中
-
-    def _add_merge(self, _from, _to):
-        # 两个区域号赋值给类属性
-        self.last_from = _from
-        self.last_to = _to
-        # 记录self.merge_regions的某个索引值，初始化为-1
-        from_index = -1
-        # 记录self.merge_regions的某个索引值，初始化为-1
-        to_index = -1
-
-        # 遍历每个 self.merge_regions的元素
-        for index, region in enumerate(self.merge_regions):
-            # 遍历元素的每个区域号
-            for r_index in region:
-                if r_index == _from:
-                    from_index = index
-                if r_index == _to:
-                    to_index = index
-
-        # 若两个区域号都在 self.merge_regions中
-        if from_index != -1 and to_index != -1:
-            # 那么这两个区域号分别在两个列表中，合并这两个列表
-            if from_index != to_index:
-                self.merge_regions[from_index].extend(self.merge_regions[to_index])
-                del(self.merge_regions[to_index])
-            return
-            # 若两个区域号都不在 self.merge_regions中
-        if from_index == -1 and to_index == -1:
-            # 创建新的区域号列表
-            self.merge_regions.append([_from, _to])
-            return
-        # 若两者之间有一个存在于 self.merge_regions中
-        # 将不存在self.merge_regions中的区域号添加到另一个区域号所在的列表
-        if from_index != -1 and to_index == -1:
-            self.merge_regions[from_index].append(_to)
-            return
-        if from_index == -1 and to_index != -1:
-            self.merge_regions[to_index].append(_from)
-            return
-
-    def _merge(self, detected_regions, merge_regions):
-        # 该方法将self.merge_regions中的元素区域号所代表的区域合并，得到新的皮肤区域列表
-        # 新的列表为new_detected_regions
-        # 其元素是包含一些代表像素的 Skin 对象的列表
-        # new_detected_regions的元素即代表皮肤区域，元素索引为区域号
-        new_detected_regions = []
-
-        # 将merge_regions中的元素中的区域号所代表的所有区域合并
-        for index, region in enumerate(merge_regions):
-            try:
-                new_detected_regions[index]
-            except IndexError:
-                new_detected_regions.append([])
-            for r_index in region:
-                new_detected_regions[index].extend(detected_regions[r_index])
-                detected_regions[r_index] = []
-
-        # 添加剩余的其余皮肤区域到 new_detected_regions
-        for region in detected_regions:
-            if len(region) > 0:
-                new_detected_regions.append(region)
-
-        # 清理new_detected_regions
-        self._clear_regions(new_detected_regions)
-
     # self._clear_regions()方法是将像素数大于指定数量的皮肤区域保留到self.skin_regions
     # 皮肤区域清理函数
     # 只保存像素数大于指定数量的皮肤区域
-    def _clear_regions(self, detected_regions):
-        for region in detected_regions:
-            if len(region) > 30:
-                self.skin_regions.append(region)
+    def _clear_regions(self, region_sizes):
+        for label, size in enumerate(region_sizes):
+            if size > self.min_region_size:
+                self.skin_regions.append(size)
+                self.skin_labels.add(label)
 
-    # 分析函数
+    # 分析函数，判定规则见 judge()
     def _analyse_regions(self):
-        # 如果皮肤区域小于3个，不是色情
-        if len(self.skin_regions) < 3:
-            self.message = "Less than 3 skin regions ({_skin_regions_size})".format(
-                            _skin_regions_size=len(self.skin_regions))
-            self.result = False
-            return self.result
-
         # 为皮肤区域排序
-        self.skin_regions = sorted(self.skin_regions, key=lambda s: len(s), reverse=True)
-
+        self.skin_regions = sorted(self.skin_regions, reverse=True)
         # 计算皮肤总像素数
-        total_skin = float(sum([len(skin_region) for skin_region in self.skin_regions]))
-
-        # 如果皮肤区域与整个图像的比值小于15%,不是色情图片
-        if total_skin / self.total_pixels * 100 < 15:
-            self.message = "Total skin percentage lower than 15({:.2f})".format(
-                total_skin / self.total_pixels * 100
-            )
-            self.result = False
-            return self.result
-
-        # 如果最大皮肤区域小于总皮肤面积的45%，不是色情图片
-        if len(self.skin_regions[0]) / total_skin * 100 < 45:
-            self.message = "The biggest region contains less than 45 ({:.2f})".format(
-                len(self.skin_regions[0]) / total_skin * 100
-            )
-            self.result = False
-            return self.result
-
-        # 如果皮肤区域数量超过60个，不是色情图片
-        if len(self.skin_regions) > 60:
-            self.message = "More than 60 skin regions ({})".format(
-                len(self.skin_regions)
-            )
-            self.result = False
-            return self.result
-
-        # 其他情况为色情图片
-        self.message = "Nude!!"
-        self.result = True
+        total_skin = float(sum(self.skin_regions))
+        largest = self.skin_regions[0] if self.skin_regions else 0
+        self.result, self.decided_by, self.message = judge(
+            len(self.skin_regions), total_skin, largest, self.total_pixels, self.thresholds)
         return self.result
 
+    # 解析得到的所有皮肤区域的紧凑汇总，可用 evaluate_summary() 按其他阈值重新判定而无需重新解析
+    def region_summary(self, floor=0):
+        """
+        返回 {"total_pixels": 总像素数, "floor": floor, "sizes": 像素数大于 floor 的区域的像素数（从大到小）}
+        floor 越大汇总越小，但之后只能判定不小于 floor 的 min_region_size
+        流式解析时像素数不大于 min_region_size 的区域已被丢弃，floor 至少为 min_region_size
+        """
+        if self.result is None:
+            raise ValueError("The image has not been parsed yet")
+        if self.stopped_row is not None or self.pyramid_level not in (None, 1):
+            raise ValueError("The summary needs a full parse of the original image")
+        if self.labels is None:
+            floor = max(floor, self.min_region_size)
+        return {"total_pixels": self.total_pixels, "floor": floor,
+                "sizes": sorted((size for size in self.region_sizes if size > floor), reverse=True)}
+
+    # 保留下来的皮肤区域的汇总统计
+    def summary(self):
+        return {
+            "total_pixels": self.total_pixels,
+            "regions": len(self.skin_regions),
+            "skin_pixels": sum(self.skin_regions),
+            "largest_region": max(self.skin_regions) if self.skin_regions else 0,
+        }
+
+    # 字符画预览
+    def preview(self, width=80, height=40, charset=None, color=None):
+        """
+        用 ascii.py 把 self.image 转换为字符画，返回每行以换行符结尾的字符串
+        self.image 就是解析所用的图像（调用过 resize() 时为缩小后的图像），不会重新打开和解码文件
+        color 见 ascii.COLOR_MODES
+        """
+        from ascii import image_to_ascii
+        start = self._clock() if self.stats is not None else None
+        text = image_to_ascii(self.image, width, height, charset, color)
+        if start is not None:
+            self._record("preview", start)
+        return text
+
     # 组织分析得出的信息
     def inspect(self):
-        _image = '{}{}{}*{}'.format(self.image.filename, self.image.format,
+        _image = '{}{}{}*{}'.format(self.filename, self.image.format,
                                     self.width, self.height)
         return "{_image}: result = {_result} message = '{_message}'".format(
             _image=_image, _result=self.result, _message=self.message
         )
 
     # 若此时停止，只能得到文本信息，可以通过下述程序获得黑白图片，直观感受
-    def showSkinRegions(self):
+    def showSkinRegions(self, colored=False, format=None, path=None):
+        """
+        保存皮肤区域图像并返回其路径：保留下来的皮肤区域为白色，其余为黑色
+        colored 为 True 时每个皮肤区域使用不同的颜色
+        format 为输出格式的扩展名（如 "png"、"jpg"），缺省时与源文件的拓展名相同
+        path 缺省时保存到源文件所在目录，文件名为 原文件名_Nude 或 原文件名_Normal
+        """
         # 未得出结果时方法返回
         if self.result is None:
             return
-        # 皮肤像素 ID 的集合
-        skinIdSet = set()
-        # 将原图做一份拷贝
-        simage = self.image
-        # 加载数据
-        simageData = simage.load()
-
-        # 将皮肤像素的id存入 skinIdSet
-        for sr in self.skin_regions:
-            for pixel in sr:
-                skinIdSet.add(pixel.id)
-        # 将图像中的皮肤像素设置为白色，其余为黑色
-        for pixel in self.skin_map:
-            if pixel.id not in skinIdSet:
-                simageData[pixel.x, pixel.y] = 0, 0, 0
+        if self.labels is None:
+            if self.pyramid_level and self.pyramid_level > 1:
+                raise ValueError("showSkinRegions() needs the label map, but the result was decided "
+                                 "on a copy reduced {} times; parse without pyramid".format(
+                                     self.pyramid_level))
+            raise ValueError("showSkinRegions() needs the label map, parse without streaming")
+        start = self._clock() if self.stats is not None else None
+        # 不再修改 self.image，而是根据区域号数组一次性生成新的图像
+        simage = self._regions_image(colored)
+
+        if format:
+            # 用户给出的是扩展名（如 jpg），PIL 需要注册的格式名（如 JPEG）
+            extension = "." + format.lower().lstrip(".")
+            format = Image.registered_extensions().get(extension)
+            if format is None:
+                raise ValueError("Unknown image format: {}".format(extension[1:]))
+        if path is None:
+            # 源文件绝对路径，内存中的图像没有文件名时保存到当前目录
+            filePath = os.path.abspath(self.filename or "image")
+            # 分离源文件的路径得到文件名和拓展名
+            fileName, fileExtName = os.path.splitext(filePath)
+            if format:
+                fileExtName = extension
+            elif not fileExtName:
+                fileExtName = ".png"
+            path = '{}_{}{}'.format(fileName, 'Nude' if self.result else 'Normal', fileExtName)
+        # 保存图片
+        simage.save(path, format=format)
+        if start is not None:
+            self._record("visualize", start)
+        return path
+
+    # 区域号到颜色的映射：下标为区域号 + 1（非肤色像素的区域号为 -1）
+    def _region_palette(self, colored):
+        palette = [(0, 0, 0)] * (len(self.region_sizes) + 1)
+        for label in self.skin_labels:
+            if colored:
+                # 用区域号生成固定的伪随机颜色，同一区域每次的颜色相同
+                h = (label * 2654435761) & 0xffffff
+                palette[label + 1] = (64 + (h >> 16) % 192, 64 + (h >> 8 & 255) % 192, 64 + (h & 255) % 192)
             else:
-                simageData[pixel.x, pixel.y] = 255, 255, 255
-        # 源文件绝对路径
-        filePath = os.path.abspath(self.image.filename)
-        # 源文件所在目录
-        fileDirectory = os.path.dirname(filePath) + '/'
-        # 源文件完整文件名
-        fileFullNmae = os.path.basename(filePath)
-        # 分离源文件的完整文件名得到文件名和拓展名
-        fileName, fileExtName = os.path.split(fileFullNmae)
-        # 保持图片
-        simage.save('{}{}_{}{}'.format(fileDirectory, fileName, 'Nude'
-                                       if self.result else 'Normal', fileExtName))
+                palette[label + 1] = (255, 255, 255)
+        return palette
+
+    def _regions_image(self, colored=False):
+        palette = self._region_palette(colored)
+        mode = "RGB" if colored else "L"
+        if np is not None:
+            # 用区域号查调色板，一次得到所有像素的颜色
+            colors = np.array(palette, dtype=np.uint8)
+            if not colored:
+                colors = colors[:, 0]
+            pixels = colors[self.labels + 1]
+            shape = (self.height, self.width, 3) if colored else (self.height, self.width)
+            return Image.fromarray(pixels.reshape(shape), mode)
+        if colored:
+            data = b"".join(bytes(palette[label + 1]) for label in self.labels)
+        else:
+            data = bytes(palette[label + 1][0] for label in self.labels)
+        return Image.frombytes(mode, (self.width, self.height), data)
 
     def _to_hsv(self, r, g, b):
         h = 0
@@ -443,24 +1015,542 @@ class Nude(object):
         return [h, 1.0 - (3.0 * (_min / _sum)), (1.0 / 3.0) * _max]
 
 
+# ######################肤色查找表#######################
+
+# 肤色判定只与 (r, g, b) 有关，可以预先算出全部 2^24 种颜色的结果，每种颜色占 1 位，共 2 MB
+# 查找表保存在磁盘上并通过内存映射读取，多个进程可以共享同一份页缓存
+# 修改判定规则后需要重新生成：文件名中包含判定规则源代码的摘要，规则改变后会自动生成新的查找表
+SKIN_TABLE_VERSION = 1
+
+# 判定结果所依赖的方法
+_SKIN_RULE_METHODS = ("_classify_skin", "_skin_mask", "_to_normalized", "_to_hsv", "_to_ycbcr")
+
+# 已加载的查找表，键为文件路径
+_skin_tables = {}
+
+
+def skin_table_dir():
+    """查找表所在目录，可以通过环境变量 NUDE_TABLE_DIR 指定"""
+    return os.environ.get("NUDE_TABLE_DIR") or os.path.join(
+        os.path.expanduser("~"), ".cache", "nude_jpg")
+
+
+def skin_table_key(classifiers):
+    """由判定规则组合和规则源代码得到查找表的版本号"""
+    # 规则之间是“或”的关系，与顺序无关
+    return _skin_table_key(tuple(sorted(set(classifiers))))
+
+
+@functools.lru_cache(maxsize=None)
+def _skin_table_key(classifiers):
+    # 读取源代码较慢（每次十几毫秒），同一进程中只计算一次
+    digest = hashlib.sha1(str(SKIN_TABLE_VERSION).encode())
+    for name in list(_SKIN_RULE_METHODS) + ["_{}_classifier".format(c) for c in classifiers] +\
+            ["_{}_mask".format(c) for c in classifiers]:
+        try:
+            digest.update(inspect.getsource(getattr(Nude, name)).encode())
+        except (OSError, TypeError):
+            # 拿不到源代码时只依赖 SKIN_TABLE_VERSION
+            digest.update(name.encode())
+    return "{}-{}".format("+".join(classifiers), digest.hexdigest()[:12])
+
+
+def skin_table_path(classifiers, directory=None):
+    return os.path.join(directory or skin_table_dir(), "skin-{}.bin".format(skin_table_key(classifiers)))
+
+
+def build_skin_table(classifiers=("ycbcr",), directory=None):
+    """
+    计算全部颜色的判定结果并保存为位数组，返回文件路径
+    先写入临时文件再改名，多个进程同时生成也不会读到不完整的文件
+    """
+    path = skin_table_path(classifiers, directory)
+    checker = Nude(Image.new("RGB", (1, 1)), classifiers=classifiers)
+    if np is not None:
+        # 每次计算 r 的 16 个取值，共 2^20 种颜色
+        gb = np.arange(1 << 16, dtype=np.uint32)
+        chunks = []
+        for r in range(0, 256, 16):
+            rgb = np.empty((16, 1 << 16, 3), dtype=np.uint8)
+            rgb[..., 0] = np.arange(r, r + 16, dtype=np.uint8)[:, None]
+            rgb[..., 1] = gb >> 8
+            rgb[..., 2] = gb & 255
+            chunks.append(np.packbits(checker._skin_mask(rgb).ravel(), bitorder="little"))
+        data = np.concatenate(chunks).tobytes()
+    else:
+        # 没有 numpy 时逐个颜色判定，需要几分钟
+        table = bytearray(1 << 21)
+        for index in range(1 << 24):
+            if checker._classify_skin(index >> 16, (index >> 8) & 255, index & 255):
+                table[index >> 3] |= 1 << (index & 7)
+        data = bytes(table)
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return path
+
+
+def load_skin_table(classifiers=("ycbcr",), directory=None, build=True):
+    """
+    内存映射查找表，不存在时（build 为 True）先生成
+    安装了 numpy 时返回 uint8 数组，否则返回 mmap 对象，两者都可以按字节下标取值
+    """
+    path = skin_table_path(classifiers, directory)
+    if path not in _skin_tables:
+        if not os.path.exists(path):
+            if not build:
+                raise IOError("Skin lookup table not found: {}".format(path))
+            build_skin_table(classifiers, directory)
+        if np is not None:
+            _skin_tables[path] = np.memmap(path, dtype=np.uint8, mode="r")
+        else:
+            with open(path, "rb") as f:
+                _skin_tables[path] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return _skin_tables[path]
+
+
+# ######################结果缓存#######################
+
+# 同一张图片（转发、重复上传）会被反复扫描，按图片内容的摘要缓存判定结果，命中时无需解码
+# 缓存保存在 SQLite 数据库中，多个进程可以同时读写；按最近访问时间淘汰最旧的记录，并删除过期记录
+
+# 与判定结果有关的方法，修改后缓存的版本号随之改变
+_RESULT_METHODS = ("parse", "parse_pyramid", "_certain", "_decide_early", "_clear_regions",
+                   "_analyse_regions", "resize")
+
+# 影响判定结果或信息的扫描选项
+_RESULT_OPTIONS = ("classifiers", "connectivity", "resize", "maxwidth", "maxheight", "resample", "draft",
+                   "early_exit", "pyramid")
+
+
+def result_version(options):
+    """由判定规则、阈值和扫描选项得到缓存的版本号"""
+    options = dict((key, options.get(key)) for key in _RESULT_OPTIONS)
+    options["classifiers"] = sorted(set(options["classifiers"] or ("ycbcr",)))
+    digest = hashlib.sha1(_code_version(tuple(options["classifiers"])).encode())
+    digest.update(json.dumps(options, sort_keys=True).encode())
+    digest.update(repr(tuple(Nude.THRESHOLDS)).encode())
+    return digest.hexdigest()[:16]
+
+
+@functools.lru_cache(maxsize=None)
+def _code_version(classifiers):
+    # 判定规则的源代码在进程运行期间不会改变，每个进程只读取一次
+    digest = hashlib.sha1(skin_table_key(classifiers).encode())
+    digest.update(inspect.getsource(judge).encode())
+    for name in _RESULT_METHODS:
+        try:
+            digest.update(inspect.getsource(getattr(Nude, name)).encode())
+        except (OSError, TypeError):
+            digest.update(name.encode())
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    """
+    以 (图片内容的 SHA-256, 版本号) 为键的判定结果缓存
+    max_entries 为最多保存的记录数，超出时淘汰最久未访问的记录；max_age 为记录的有效期（秒）
+    数据库出错时只当作未命中，不影响扫描；无法打开数据库时 error 为出错信息，之后的读写都直接跳过
+    """
+
+    # 每写入这么多条记录检查一次是否需要淘汰
+    EVICT_EVERY = 256
+
+    def __init__(self, path=None, max_entries=100000, max_age=30 * 24 * 3600):
+        self.path = path or os.path.join(skin_table_dir(), "results.sqlite")
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._puts = 0
+        self.db = None
+        self.error = None
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            # 自动提交，WAL 模式下读写互不阻塞，写入冲突时最多等待 timeout 秒
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            try:
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("CREATE TABLE IF NOT EXISTS results (digest TEXT, version TEXT, record TEXT, "
+                           "created REAL, accessed REAL, PRIMARY KEY (digest, version))")
+                db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+            except sqlite3.Error:
+                db.close()
+                raise
+            self.db = db
+        except (OSError, sqlite3.Error) as e:
+            # 缓存目录不可写（只读的 HOME、错误的 --cache 等）时不使用缓存，照常扫描
+            self.error = "{}: {}".format(type(e).__name__, e)
+
+    def get(self, digest, version):
+        """返回缓存的结果字典，未命中时返回 None"""
+        if self.db is None:
+            return None
+        now = time.time()
+        try:
+            row = self.db.execute("SELECT record, created, accessed FROM results WHERE digest = ? "
+                                  "AND version = ?", (digest, version)).fetchone()
+            if row is None:
+                return None
+            record, created, accessed = row
+            if self.max_age and created < now - self.max_age:
+                self.db.execute("DELETE FROM results WHERE digest = ? AND version = ?",
+                                (digest, version))
+                return None
+            # 访问时间只需要大致准确，一分钟内不重复更新以减少写入
+            if accessed < now - 60:
+                self.db.execute("UPDATE results SET accessed = ? WHERE digest = ? AND version = ?",
+                                (now, digest, version))
+        except sqlite3.Error:
+            return None
+        return json.loads(record)
+
+    def put(self, digest, version, record):
+        if self.db is None:
+            return
+        now = time.time()
+        try:
+            self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                            (digest, version, json.dumps(record), now, now))
+            self._puts += 1
+            if self._puts % self.EVICT_EVERY == 1:
+                self.evict()
+        except sqlite3.Error:
+            pass
+
+    def evict(self):
+        """删除过期记录，并在记录数超过上限时删除最久未访问的记录"""
+        if self.max_age:
+            self.db.execute("DELETE FROM results WHERE created < ?", (time.time() - self.max_age,))
+        if self.max_entries:
+            count = self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            if count > self.max_entries:
+                self.db.execute("DELETE FROM results WHERE rowid IN (SELECT rowid FROM results "
+                                "ORDER BY accessed LIMIT ?)", (count - self.max_entries,))
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+
+
+# 每个进程各自打开的缓存，键为 (路径, 进程号)，数据库连接不能跨进程使用
+_result_caches = {}
+
+
+def open_result_cache(path=None, max_entries=100000, max_age=30 * 24 * 3600):
+    key = (path, os.getpid())
+    if key not in _result_caches:
+        _result_caches[key] = ResultCache(path, max_entries, max_age)
+    return _result_caches[key]
+
+
+# ######################批量扫描#######################
+
+# 批量模式下从目录中收集的图片扩展名
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp", ".tif", ".tiff")
+
+# 命令行中可选的重采样滤波器
+RESAMPLE_FILTERS = {
+    "nearest": Image.NEAREST,
+    "box": Image.BOX,
+    "bilinear": Image.BILINEAR,
+    "hamming": Image.HAMMING,
+    "bicubic": Image.BICUBIC,
+    "lanczos": Image.LANCZOS,
+}
+
+
+def preview_size(text):
+    """解析 "宽x高" 形式的字符画尺寸，例如 80x40"""
+    try:
+        width, height = [int(x) for x in text.lower().split("x")]
+    except ValueError:
+        raise ValueError("Expected WIDTHxHEIGHT, not {!r}".format(text))
+    if width < 1 or height < 1:
+        raise ValueError("Preview size must be positive: {!r}".format(text))
+    return width, height
+
+
+def iter_images(paths, file_list=None):
+    """
+    依次产生待扫描的文件路径
+    paths 中的目录会被递归遍历，只收集扩展名在 IMAGE_EXTENSIONS 中的文件
+    file_list 为每行一个路径的文本文件，"-" 表示标准输入
+    """
+    paths = list(paths)
+    if file_list:
+        f = sys.stdin if file_list == "-" else open(file_list)
+        try:
+            for line in f:
+                line = line.strip()
+                if line:
+                    paths.append(line)
+        finally:
+            if f is not sys.stdin:
+                f.close()
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def scan_file(fname, **options):
+    """
+    扫描单个文件，返回可以序列化为 JSON 的结果字典，options 见 _scan()
+    任何异常都会被记录到 error 字段中，不会影响其他文件
+    """
+    return _scan(fname, {"file": fname}, **options)
+
+
+def scan_bytes(data, **options):
+    """
+    扫描内存中的图像数据（例如从网络收到的文件内容），直接从内存解码，不写临时文件
+    不支持 visualization 选项，其余与 scan_file() 相同
+    """
+    return _scan(io.BytesIO(data), {"bytes": len(data)}, **options)
+
+
+def _scan(source, record, resize=False, visualization=False, classifiers=("ycbcr",), connectivity=8,
+          streaming=False, early_exit=False, resample="lanczos", draft=False,
+          lookup_table=False, colored=False, output_format=None, stats=False, pyramid=False,
+          cache=False, cache_path=None, cache_entries=100000, cache_days=30, preview=None,
+          preview_color=None, preview_template=None, maxwidth=600, maxheight=800):
+    # resize 为 True 时把图像缩小到不超过 maxwidth x maxheight
+    # cache 为 True 时先按图片内容的摘要查找缓存的结果，命中时不再解码
+    # preview 为 (宽, 高) 时用判定所用的同一幅（缩小后的）图像生成字符画，图像只打开和解码一次
+    # 字符画保存在 preview 字段中；给出 preview_template 时改为写入文件，模板见 ascii.output_path()
+    record.update(result=None, message=None)
+    start = time.perf_counter()
+    try:
+        if cache:
+            if isinstance(source, str):
+                with open(source, "rb") as f:
+                    data = f.read()
+                record["bytes"] = len(data)
+            else:
+                data = source.getvalue()
+            digest = hashlib.sha256(data).hexdigest()
+            version = result_version(dict(classifiers=classifiers, connectivity=connectivity,
+                                          resize=resize, maxwidth=maxwidth, maxheight=maxheight,
+                                          resample=resample, draft=draft, early_exit=early_exit,
+                                          pyramid=pyramid))
+            results = open_result_cache(cache_path, cache_entries, cache_days * 24 * 3600)
+            if results.error:
+                record["cache_error"] = results.error
+            # 需要生成皮肤区域图像或字符画时仍然要解析
+            cached = None if visualization or preview else results.get(digest, version)
+            if cached is not None:
+                record.update(cached)
+                record["cached"] = True
+                record["elapsed"] = round(time.perf_counter() - start, 6)
+                return record
+            # 已经读入内存，直接从内存解码
+            source = io.BytesIO(data)
+        elif isinstance(source, str):
+            record["bytes"] = os.path.getsize(source)
+        n = Nude(source, classifiers=classifiers, connectivity=connectivity,
+                 lookup_table=lookup_table, instrument=stats)
+        if "file" in record:
+            # 从内存解码时图像没有文件名，皮肤区域图像仍然保存在源文件旁边
+            n.filename = record["file"]
+        record["width"], record["height"] = n.width, n.height
+        if resize:
+            n.resize(maxwidth=maxwidth, maxheight=maxheight, resample=RESAMPLE_FILTERS[resample],
+                     draft=draft)
+            record.update(n.resize_info)
+        if pyramid:
+            n.parse_pyramid(streaming=streaming, early_exit=early_exit)
+            record["pyramid_level"] = n.pyramid_level
+        else:
+            n.parse(streaming=streaming, early_exit=early_exit)
+        # 先记录判定结果，之后生成字符画或皮肤区域图像出错时结果仍然有效
+        record["result"], record["message"] = n.result, n.message
+        record["decided_by"], record["stopped_row"] = n.decided_by, n.stopped_row
+        if preview:
+            text = n.preview(preview[0], preview[1], color=preview_color)
+            if preview_template and "file" in record:
+                from ascii import output_path
+                path = output_path(preview_template, record["file"], *preview)
+                if os.path.dirname(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "w") as f:
+                    f.write(text)
+                record["preview_path"] = path
+            else:
+                record["preview"] = text
+        if visualization and "file" in record:
+            # 没有区域号数组时（streaming，或金字塔在缩小的图像上得出结果）无法生成皮肤区域图像，但不影响判定结果
+            try:
+                record["visualization"] = n.showSkinRegions(colored=colored, format=output_format)
+            except ValueError as e:
+                record["visualization_error"] = str(e)
+        record["summary"] = n.summary()
+        if cache:
+            results.put(digest, version, dict((key, record[key]) for key in (
+                "result", "message", "width", "height", "decided_by", "stopped_row",
+                "pyramid_level", "summary") if key in record))
+        if stats:
+            record["stats"] = n.stats
+    except Exception as e:
+        message = str(e)
+        if "file" in record and isinstance(source, io.BytesIO):
+            # PIL 的出错信息中只有内存文件对象，换成文件路径
+            message = message.replace(repr(source), repr(record["file"]))
+        record["error"] = "{}: {}".format(type(e).__name__, message)
+    record["elapsed"] = round(time.perf_counter() - start, 6)
+    return record
+
+
+def _scan_file(args):
+    fname, options = args
+    return scan_file(fname, **options)
+
+
+def batch_scan(files, jobs=None, ordered=True, chunksize=4, **options):
+    """
+    使用进程池并行扫描 files 中的文件，逐个产生 scan_file() 的结果字典
+    ordered 为 True 时按输入顺序产生结果，否则按完成顺序产生
+    jobs 为进程数，缺省时为 CPU 核数；jobs 为 1 时直接在当前进程中扫描
+    """
+    tasks = ((fname, options) for fname in files)
+    if jobs == 1:
+        for task in tasks:
+            yield _scan_file(task)
+        return
+    from multiprocessing import Pool
+    with Pool(jobs) as pool:
+        results = pool.imap(_scan_file, tasks, chunksize) if ordered else\
+            pool.imap_unordered(_scan_file, tasks, chunksize)
+        for record in results:
+            yield record
+
+
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description='Detect nudity in images/')
-    parser.add_argument('files', metavar='image', nargs='+', help='Images you wish to test')
+    parser.add_argument('files', metavar='image', nargs='*', help='Images you wish to test'
+                        ' (directories are scanned recursively in batch mode)')
     parser.add_argument('-r', '--resize', action='store_true', help='Reduce image'
                         'size to increase speed of scanning')
+    parser.add_argument('--resample', choices=sorted(RESAMPLE_FILTERS), default='lanczos',
+                        help='Resampling filter used by --resize (default: lanczos)')
+    parser.add_argument('--draft', action='store_true', help='Let the decoder reduce JPEG '
+                        'images while decoding when resizing (faster, slightly different pixels)')
     parser.add_argument('-v', '--visualization', action='store_true', help='Generating'
                         'areas of image')
+    parser.add_argument('--colored', action='store_true', help='Give each skin region its own '
+                        'colour in the visualization')
+    parser.add_argument('--format', help='File extension of the visualization, e.g. png or jpg '
+                        '(default: same as the source file)')
+    parser.add_argument('-c', '--classifier', action='append', choices=Nude.CLASSIFIERS,
+                        help='Skin classifier to combine, can be given several times '
+                        '(default: ycbcr)')
+    parser.add_argument('--connectivity', type=int, choices=(4, 8), default=8,
+                        help='Pixel connectivity used to build skin regions (default: 8)')
+    parser.add_argument('-s', '--streaming', action='store_true', help='Parse in row bands '
+                        'with bounded memory, for very large images (no visualization)')
+    parser.add_argument('-e', '--early-exit', action='store_true', help='Stop scanning as soon '
+                        'as the result is certain; the message then names the rule that settled it '
+                        'early, which may differ from the one a full scan reports')
+    parser.add_argument('--lut', action='store_true', help='Classify pixels with the cached '
+                        'skin lookup table (built on first use)')
+    parser.add_argument('--build-lut', action='store_true', help='Build the skin lookup table '
+                        'for the selected classifiers and exit')
+    parser.add_argument('-p', '--pyramid', action='store_true', help='Decide on downsampled '
+                        'copies first and only parse the full image when the result is close '
+                        'to a threshold')
+    parser.add_argument('--stats', action='store_true', help='Print per-phase timings and '
+                        'counters for each image')
+    parser.add_argument('-b', '--batch', action='store_true', help='Scan images in parallel '
+                        'and write one JSON record per image')
+    parser.add_argument('-l', '--file-list', help='Newline-delimited list of images to scan '
+                        '("-" for stdin), implies --batch')
+    parser.add_argument('-j', '--jobs', type=int, help='Number of worker processes in batch '
+                        'mode (default: number of CPUs)')
+    parser.add_argument('-u', '--unordered', action='store_true', help='Write batch results '
+                        'as they complete instead of in input order')
+    parser.add_argument('-o', '--output', help='Write batch results to this file instead of stdout')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the batch '
+                        'result cache')
+    parser.add_argument('--cache', metavar='PATH', help='SQLite result cache used in batch mode '
+                        '(default: ~/.cache/nude_jpg/results.sqlite)')
+    parser.add_argument('--cache-entries', type=int, default=100000,
+                        help='Most results kept in the cache (default: 100000)')
+    parser.add_argument('--cache-days', type=float, default=30,
+                        help='Days a cached result stays valid (default: 30)')
+    parser.add_argument('--preview', type=preview_size, metavar='WxH', help='Also render an '
+                        'ASCII preview of this size from the same decoded (and resized) image')
+    parser.add_argument('--preview-color', choices=('truecolor', '256', '16'),
+                        help='Colour the ASCII preview with ANSI escape codes')
+    parser.add_argument('--preview-template', help='Write batch previews to files named by '
+                        'this template, e.g. {dir}/{name}.txt, instead of the JSON records')
     args = parser.parse_args()
+    classifiers = args.classifier or ("ycbcr",)
+    if args.build_lut:
+        print(build_skin_table(classifiers))
+        sys.exit(0)
+    if not args.files and not args.file_list:
+        parser.error('no images given')
+    if args.format and "." + args.format.lower().lstrip(".") not in Image.registered_extensions():
+        parser.error('unknown image format: {}'.format(args.format))
+    if args.visualization and args.streaming:
+        parser.error('--visualization needs the label map, which --streaming does not keep')
+    if args.visualization and args.pyramid:
+        parser.error('--visualization needs the full-size label map, which --pyramid may skip')
 
-    for fname in args.files:
-        if os.path.isfile(fname):
-            n = Nude(fname)
-            if args.resize:
-                n.resize(maxheight=800, maxwidth=600)
-            n.parse()
-            if args.visualization:
-                n.showSkinRegions()
-            print(n.result, n.inspect())
-        else:
-            print(fname, "is not a file")
+    if args.batch or args.file_list:
+        out = open(args.output, 'w') if args.output else sys.stdout
+        try:
+            for record in batch_scan(iter_images(args.files, args.file_list), jobs=args.jobs,
+                                     ordered=not args.unordered, resize=args.resize,
+                                     resample=args.resample, draft=args.draft,
+                                     visualization=args.visualization, streaming=args.streaming,
+                                     early_exit=args.early_exit, classifiers=classifiers,
+                                     connectivity=args.connectivity, lookup_table=args.lut,
+                                     colored=args.colored, output_format=args.format,
+                                     stats=args.stats, pyramid=args.pyramid,
+                                     cache=not args.no_cache, cache_path=args.cache,
+                                     cache_entries=args.cache_entries,
+                                     cache_days=args.cache_days, preview=args.preview,
+                                     preview_color=args.preview_color,
+                                     preview_template=args.preview_template):
+                out.write(json.dumps(record) + '\n')
+                out.flush()
+        finally:
+            if out is not sys.stdout:
+                out.close()
+    else:
+        for fname in args.files:
+            if os.path.isfile(fname):
+                n = Nude(fname, classifiers=classifiers, connectivity=args.connectivity,
+                         lookup_table=args.lut, instrument=args.stats)
+                if args.resize:
+                    n.resize(maxheight=800, maxwidth=600,
+                             resample=RESAMPLE_FILTERS[args.resample], draft=args.draft)
+                if args.pyramid:
+                    n.parse_pyramid(streaming=args.streaming, early_exit=args.early_exit)
+                else:
+                    n.parse(streaming=args.streaming, early_exit=args.early_exit)
+                if args.visualization:
+                    n.showSkinRegions(colored=args.colored, format=args.format)
+                print(n.result, n.inspect())
+                if args.preview:
+                    sys.stdout.write(n.preview(args.preview[0], args.preview[1],
+                                               color=args.preview_color))
+                if args.stats:
+                    print(json.dumps(n.stats))
+            else:
+                print(fname, "is not a file")
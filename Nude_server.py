@@ -0,0 +1,283 @@
+# 常驻的色情图片检测服务
+# 每次运行 Nude_jpg.py 都要启动解释器、导入 PIL，而服务进程只启动一次，并保持若干个预热好的工作进程
+# 客户端通过本机 HTTP 或 Unix 套接字发送图片数据或图片路径，服务返回 JSON 格式的 result 和 message
+
+# 接口：
+# POST /scan            请求体为图片数据，直接在内存中解码
+# POST /scan            Content-Type 为 application/json，请求体为 {"path": "图片路径"}
+# GET  /health          返回服务状态和排队中的请求数
+
+# 排队中的请求数有上限，超过上限时立即返回 503，由客户端稍后重试（背压）
+# 每个请求都有超时时间，超时返回 504
+# 默认按图片内容缓存检测结果，重复的图片直接返回缓存的结果（--no-cache 关闭）
+# 收到 SIGTERM 或 SIGINT 后停止接收新请求，等待已接收的请求处理完再退出
+
+import sys
+import os
+import json
+import signal
+import threading
+import socketserver
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import Nude_jpg
+
+
+def _ping():
+    return None
+
+
+def _warm_up(options):
+    # 工作进程与服务进程在同一个进程组中，忽略 Ctrl-C，只由服务进程处理，等待处理中的请求完成后再退出
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # 工作进程启动时预先加载查找表，避免第一个请求变慢
+    if options.get("lookup_table"):
+        Nude_jpg.load_skin_table(options.get("classifiers", ("ycbcr",)))
+
+
+class NudeService(object):
+    """
+    工作进程池和排队上限
+    jobs 为工作进程数，max_pending 为同时排队和处理中的请求数上限，timeout 为每个请求的超时时间（秒）
+    options 为传给 Nude_jpg.scan_bytes() / scan_file() 的检测选项
+    """
+
+    def __init__(self, jobs=None, max_pending=None, timeout=30.0, options=None):
+        self.options = dict(options or {})
+        self.options.pop("visualization", None)
+        self.options.pop("preview_template", None)
+        self.timeout = timeout
+        self.jobs = jobs or os.cpu_count() or 1
+        self.executor = self._start()
+        self.max_pending = max_pending or self.jobs * 4
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._restart_lock = threading.Lock()
+        self.pending = 0
+
+    def _start(self):
+        executor = ProcessPoolExecutor(self.jobs, initializer=_warm_up, initargs=(self.options,))
+        # 工作进程是按需启动的，先提交空任务让所有工作进程都启动并完成预热
+        for future in [executor.submit(_ping) for _ in range(self.jobs)]:
+            future.result()
+        return executor
+
+    def submit(self, func, *args):
+        """
+        提交一个检测任务并等待结果
+        排队已满时返回 None，超时时抛出 concurrent.futures.TimeoutError
+        工作进程异常退出（例如内存不足被杀死）时重建进程池，并抛出 BrokenProcessPool
+        """
+        if not self._slots.acquire(blocking=False):
+            return None
+        with self._lock:
+            self.pending += 1
+        executor = self.executor
+        try:
+            future = executor.submit(func, *args, **self.options)
+        except BrokenProcessPool:
+            self._release()
+            self._restart(executor)
+            raise
+        except BaseException:
+            self._release()
+            raise
+        # 超时的任务无法中断，仍然占用排队名额，直到它真正结束
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=self.timeout)
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise
+
+    def _release(self, future=None):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def _restart(self, broken):
+        # 多个请求可能同时发现进程池已损坏，只重建一次
+        with self._restart_lock:
+            if self.executor is not broken:
+                return
+            broken.shutdown(wait=False)
+            self.executor = self._start()
+
+    def scan_bytes(self, data):
+        return self.submit(Nude_jpg.scan_bytes, data)
+
+    def scan_file(self, path):
+        return self.submit(Nude_jpg.scan_file, path)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+class NudeRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "NudeServer/1.0"
+    # 空闲的长连接在该时间（秒）后关闭，否则关闭服务时会一直等待这些连接
+    timeout = 10
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self._reply(404, {"error": "Not found"})
+        service = self.server.service
+        self._reply(200, {"status": "ok", "pending": service.pending,
+                          "max_pending": service.max_pending})
+
+    def do_POST(self):
+        if self.path != "/scan":
+            return self._reply(404, {"error": "Not found"})
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            return self._reply(411, {"error": "Content-Length required"})
+        if length < 0:
+            return self._reply(400, {"error": "Invalid Content-Length"})
+        if length > self.server.max_bytes:
+            return self._reply(413, {"error": "Request body larger than {} bytes".format(
+                self.server.max_bytes)})
+        data = self.rfile.read(length)
+
+        service = self.server.service
+        try:
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                body = json.loads(data.decode("utf-8"))
+                path = body.get("path") if isinstance(body, dict) else None
+                if not isinstance(path, str):
+                    return self._reply(400, {"error": "JSON body must contain a path"})
+                record = service.scan_file(path)
+            else:
+                record = service.scan_bytes(data)
+        except ValueError as e:
+            return self._reply(400, {"error": str(e)})
+        except TimeoutError:
+            return self._reply(504, {"error": "Timed out after {} seconds".format(service.timeout)})
+        except BrokenProcessPool:
+            return self._reply(503, {"error": "Worker process died, try again"}, {"Retry-After": "1"})
+        if record is None:
+            return self._reply(503, {"error": "Server busy"}, {"Retry-After": "1"})
+        self._reply(200, record)
+
+    def _reply(self, status, body, headers=None):
+        data = (json.dumps(body) + "\n").encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Unix 套接字的客户端地址为空字符串
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class NudeHTTPServer(ThreadingHTTPServer):
+    # 关闭时等待处理中的请求完成
+    daemon_threads = False
+    block_on_close = True
+
+    def __init__(self, address, service, max_bytes, verbose=False):
+        self.service = service
+        self.max_bytes = max_bytes
+        self.verbose = verbose
+        ThreadingHTTPServer.__init__(self, address, NudeRequestHandler)
+
+
+class NudeUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = False
+    block_on_close = True
+
+    def __init__(self, path, service, max_bytes, verbose=False):
+        self.service = service
+        self.max_bytes = max_bytes
+        self.verbose = verbose
+        # 删除上次异常退出时遗留的套接字文件
+        if os.path.exists(path):
+            os.unlink(path)
+        socketserver.UnixStreamServer.__init__(self, path, NudeRequestHandler)
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def serve(server, service):
+    """运行服务直到收到 SIGTERM 或 SIGINT，然后等待处理中的请求完成并关闭工作进程"""
+    def stop(signum, frame):
+        # shutdown() 会等待 serve_forever() 返回，必须在另一个线程中调用
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Serve nudity detection over HTTP')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('-p', '--port', type=int, default=8080, help='TCP port (default: 8080)')
+    parser.add_argument('-u', '--unix', help='Listen on this Unix socket path instead of TCP')
+    parser.add_argument('-j', '--jobs', type=int, help='Number of worker processes '
+                        '(default: number of CPUs)')
+    parser.add_argument('-q', '--max-pending', type=int, help='Requests queued or in progress '
+                        'before answering 503 (default: 4 per worker)')
+    parser.add_argument('-t', '--timeout', type=float, default=30.0,
+                        help='Seconds to wait for a result (default: 30)')
+    parser.add_argument('--max-bytes', type=int, default=50 * 1024 * 1024,
+                        help='Largest accepted request body (default: 50 MB)')
+    parser.add_argument('-r', '--resize', action='store_true', help='Reduce image size to '
+                        'increase speed of scanning')
+    parser.add_argument('--draft', action='store_true', help='Let the decoder reduce JPEG '
+                        'images while decoding when resizing')
+    parser.add_argument('-e', '--early-exit', action='store_true', help='Stop scanning as soon '
+                        'as the result is certain (the message names the rule that settled it early)')
+    parser.add_argument('--lut', action='store_true', help='Classify pixels with the cached '
+                        'skin lookup table')
+    parser.add_argument('-c', '--classifier', action='append', choices=Nude_jpg.Nude.CLASSIFIERS,
+                        help='Skin classifier to combine, can be given several times '
+                        '(default: ycbcr)')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the '
+                        'result cache')
+    parser.add_argument('--cache', metavar='PATH', help='SQLite result cache '
+                        '(default: ~/.cache/nude_jpg/results.sqlite)')
+    parser.add_argument('--cache-entries', type=int, default=100000,
+                        help='Most results kept in the cache (default: 100000)')
+    parser.add_argument('--cache-days', type=float, default=30,
+                        help='Days a cached result stays valid (default: 30)')
+    parser.add_argument('--preview', type=Nude_jpg.preview_size, metavar='WxH', help='Include an '
+                        'ASCII preview of this size rendered from the same decoded image')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Log every request')
+    args = parser.parse_args()
+
+    options = {"resize": args.resize, "draft": args.draft, "early_exit": args.early_exit,
+               "lookup_table": args.lut, "classifiers": tuple(args.classifier or ("ycbcr",)),
+               "cache": not args.no_cache, "cache_path": args.cache,
+               "cache_entries": args.cache_entries, "cache_days": args.cache_days,
+               "preview": args.preview}
+    if args.lut:
+        # 在启动工作进程前生成查找表，避免多个进程同时生成
+        Nude_jpg.load_skin_table(options["classifiers"])
+    service = NudeService(args.jobs, args.max_pending, args.timeout, options)
+    if args.unix:
+        server = NudeUnixServer(args.unix, service, args.max_bytes, args.verbose)
+    else:
+        server = NudeHTTPServer((args.host, args.port), service, args.max_bytes, args.verbose)
+    print("Listening on {}".format(args.unix or "http://{}:{}".format(args.host, args.port)))
+    sys.stdout.flush()
+    serve(server, service)
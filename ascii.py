@@ -3,50 +3,25 @@
 
 from PIL import Image
 import argparse
+import collections
+import json
+from array import array
+import os
+import re
+import sys
+import time
+import queue
+import threading
+
+#numpy 为可选依赖，有 numpy 时整幅图像的灰度在一次数组运算中算出
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 #下面是字符画中所使用的字符集，一共有70个字符，字符的种类和数量可以根据字符画的效果反复调试,可以随意更改
 ascii_char = list("$@B%8&WM#*9oahkbd7pqwm6ZO0QL4eCJUY3Xzcvu6nxr。j5ft/\|(2)1{}[]?g-_+~<>i!lI;:,\"^`'. ")
 
-#####################################################################################################
-##python argparse宏包学习
-##使用argparse第一步是创建一个解析器对象，并告诉其参数；解析器类为ArgumentParser，如：
-##parser = argparse.ArgumentParse(description = "This is a example program") %description用途描述函数
-##add_argument()方法，用于接受程序需要接受的命令参数
-##一般语法：parser.add_argument('-shorname', '--fullname', type = ?, default = ?) %参数数量可选
-##注意：shortname前只需'-',对于fullname需要'--'
-##parser.add_argument('para') %这种格式是最简单的，且para这个参数是必须的
-##parser.add_argument()方法具有
-##dest：如果提供dest，例如dest="a"，那么可以通过args.a访问该参数
-##default：设置参数的默认值
-##action：参数出发的动作
-##store：保存参数，默认
-##store_const：保存一个被定义为参数规格一部分的值（常量），而不是一个来自参数解析而来的值
-##store_ture/store_false：保存相应的布尔值
-##append：将值保存在一个列表中
-##append_const：将一个定义在参数规格中的值（常量）保存在一个列表中
-##count：参数出现的次数:parser.add_argument("-v", "--verbosity", action="count",
-# default=0, help="increase output verbosity")
-##version：打印程序版本信息
-##type：把从命令行输入的结果转成设置的类型
-##choice：允许的参数值:parser.add_argument("-v", "--verbosity", type=int,
-# choices=[0, 1, 2], help="increase output verbosity")
-##help：参数命令的介绍
-##parse_args()返回值是一个命名空间，用于获取参数值
-##################################################################################################
-parser = argparse.ArgumentParser()
-
-parser.add_argument('file') #输入文件
-parser.add_argument('-o', '--output') #输出文件
-parser.add_argument('--width', type = int, default = 80) #输出字符画宽
-parser.add_argument('--height', type = int, default = 80) #输出字符画高
-
-args = parser.parse_args() #用于获取参数
-
-IMG = args.file
-WIDTH = args.width
-HEIGHT = args.height
-OUTPUT = args.output
-
 #定义get_char方法，将256灰度映射到70个字符上
 def get_char(r, g, b, alpha = 256):
     if alpha == 0:   #当'alpha = 0'时，判断图片完结
@@ -56,29 +31,640 @@ def get_char(r, g, b, alpha = 256):
     unit = (256.0 + 1) / length
     return ascii_char[int(gray / unit)]
 
+#预先算出 256 个灰度对应的字符，与 get_char() 的映射相同；第 257 项（下标 256）为透明像素对应的空格
+def char_table(charset = None):
+    charset = list(charset or ascii_char)
+    unit = (256.0 + 1) / len(charset)
+    return [charset[int(gray / unit)] for gray in range(256)] + [' ']
+
+#返回每个像素的灰度（透明像素为 256），有 numpy 时为二维数组，否则为扁平列表
+def gray_levels(im):
+    if np is not None:
+        a = np.asarray(im, dtype = np.float64)
+        if im.mode == 'L':
+            r = g = b = a
+        else:
+            r, g, b = a[..., 0], a[..., 1], a[..., 2]
+        #与 get_char() 相同的运算顺序，向下取整后结果完全一致
+        gray = (0.2116 * r + 0.7152 * g + 0.0711 * b).astype(np.intp)
+        if im.mode == 'RGBA':
+            gray[a[..., 3] == 0] = 256
+        return gray
+    #没有 numpy 时一次取出所有像素，仍然避免逐个调用 getpixel()
+    #较新的 PIL 中 getdata() 已不推荐使用，由 get_flattened_data() 代替
+    pixels = getattr(im, 'get_flattened_data', im.getdata)()
+    if im.mode == 'L':
+        return [int(0.2116 * v + 0.7152 * v + 0.0711 * v) for v in pixels]
+    if im.mode == 'RGBA':
+        return [int(0.2116 * r + 0.7152 * g + 0.0711 * b) if a else 256 for r, g, b, a in pixels]
+    return [int(0.2116 * r + 0.7152 * g + 0.0711 * b) for r, g, b in pixels]
+
+#把 RGB、RGBA、L 以外的模式转换为 RGB 或 RGBA
+def _convert(im):
+    if im.mode not in ('RGB', 'RGBA', 'L'):
+        #带透明度的图像保留 alpha 通道
+        transparent = im.mode in ('LA', 'PA', 'La', 'RGBa') or 'transparency' in im.info
+        im = im.convert('RGBA' if transparent else 'RGB')
+    return im
+
+#缩放到字符画大小，并转换为 RGB、RGBA 或 L 模式
+def prepare(image, width, height):
+    #resize(size, filter)，size具有（width，height两个参数）；NEAREST指此时选择最近的对象
+    return _convert(image.resize((width, height), Image.NEAREST))
+
+#把 prepare() 得到的图像转换为字符画的各行（不含换行符），table 为 char_table() 的结果
+def ascii_rows(im, table):
+    width, height = im.size
+    gray = gray_levels(im)
+    if np is not None and all(len(c) == 1 for c in table):
+        #查表得到 height * width 的单字符数组，再把每行看作一个长度为 width 的字符串
+        chars = np.asarray(table)[gray]
+        return np.ascontiguousarray(chars).view('<U{}'.format(width)).ravel().tolist()
+    gray = list(gray.ravel()) if np is not None else gray
+    return [''.join([table[v] for v in gray[i * width:(i + 1) * width]]) for i in range(height)]
+
+#######################################彩色输出#######################################
+
+#可选的调色板：24 位真彩色、xterm 256 色、16 色
+COLOR_MODES = ('truecolor', '256', '16')
+
+#每行末尾恢复默认颜色
+RESET = '\x1b[0m'
+
+#16 色的 ANSI 前景色代码及其 RGB 值（xterm 的默认值）
+ANSI_16 = ((30, (0, 0, 0)), (31, (205, 0, 0)), (32, (0, 205, 0)), (33, (205, 205, 0)),
+           (34, (0, 0, 238)), (35, (205, 0, 205)), (36, (0, 205, 205)), (37, (229, 229, 229)),
+           (90, (127, 127, 127)), (91, (255, 0, 0)), (92, (0, 255, 0)), (93, (255, 255, 0)),
+           (94, (92, 92, 255)), (95, (255, 0, 255)), (96, (0, 255, 255)), (97, (255, 255, 255)))
+
+#256 色中 6x6x6 色块每个分量的取值，以及相邻取值的中点
+CUBE_LEVELS = (0, 95, 135, 175, 215, 255)
+CUBE_EDGES = (48, 115, 155, 195, 235)
+
+#一个颜色对应的转义序列，key 为 color_keys() 得到的颜色编号，-1 表示透明像素（默认颜色）
+def escape(mode, key):
+    if key < 0:
+        return '\x1b[39m'
+    if mode == 'truecolor':
+        return '\x1b[38;2;{};{};{}m'.format(key >> 16, (key >> 8) & 255, key & 255)
+    if mode == '256':
+        return '\x1b[38;5;{}m'.format(key)
+    return '\x1b[{}m'.format(ANSI_16[key][0])
+
+#单个像素的颜色编号，没有 numpy 时使用，与 color_keys() 的结果相同
+def _color_key(mode, r, g, b):
+    if mode == 'truecolor':
+        return r << 16 | g << 8 | b
+    if mode == '256':
+        levels = [sum(1 for edge in CUBE_EDGES if v >= edge) for v in (r, g, b)]
+        cube = [CUBE_LEVELS[i] for i in levels]
+        shade = min(23, max(0, int((r + g + b) / 3.0 - 8 + 5) // 10))
+        gray = 8 + 10 * shade
+        if sum((v - c) ** 2 for v, c in zip((r, g, b), cube)) <= sum((v - gray) ** 2 for v in (r, g, b)):
+            return 16 + 36 * levels[0] + 6 * levels[1] + levels[2]
+        return 232 + shade
+    distances = [sum((v - c) ** 2 for v, c in zip((r, g, b), rgb)) for code, rgb in ANSI_16]
+    return distances.index(min(distances))
+
+#把 prepare() 得到的图像的每个像素量化为调色板中的颜色编号，有 numpy 时为二维数组，否则为各行的列表
+def color_keys(im, mode):
+    width, height = im.size
+    if np is None:
+        keys, cache = [], {}
+        for pixel in getattr(im, 'get_flattened_data', im.getdata)():
+            if im.mode == 'L':
+                pixel = (pixel, pixel, pixel)
+            if im.mode == 'RGBA' and pixel[3] == 0:
+                keys.append(-1)
+                continue
+            rgb = pixel[:3]
+            if rgb not in cache:
+                cache[rgb] = _color_key(mode, *rgb)
+            keys.append(cache[rgb])
+        return [keys[i * width:(i + 1) * width] for i in range(height)]
+
+    a = np.asarray(im)
+    if im.mode == 'L':
+        r = g = b = a
+    else:
+        r, g, b = a[..., 0], a[..., 1], a[..., 2]
+    if mode == 'truecolor':
+        r = r.astype(np.int32)
+        keys = r << 16 | g.astype(np.int32) << 8 | b
+    elif mode == '256':
+        #各个量都先按分量值或三个分量之和查表，只剩下整数加法和比较
+        value = np.arange(256)
+        level = np.searchsorted(CUBE_EDGES, value, side = 'right')
+        cube_error = (value - np.asarray(CUBE_LEVELS)[level]) ** 2
+        #(r + g + b) / 3 按 10 为间隔取最近的灰度 8 + 10 * shade，与 _color_key() 的取整一致
+        total = np.arange(766)
+        shade = np.clip(((total / 3.0 - 8 + 5).astype(np.int64)) // 10, 0, 23)
+        gray = 8 + 10 * shade
+        #|p - gray|^2 = r^2 + g^2 + b^2 - 2 * gray * (r + g + b) + 3 * gray^2
+        gray_term = 3 * gray * gray - 2 * gray * total
+        total = r.astype(np.int32) + g + b
+        square = value * value
+        cube_distance = cube_error[r] + cube_error[g] + cube_error[b]
+        gray_distance = square[r] + square[g] + square[b] + gray_term[total]
+        keys = np.where(cube_distance <= gray_distance,
+                        16 + 36 * level[r] + 6 * level[g] + level[b], 232 + shade[total])
+    else:
+        #|p - c|^2 = |p|^2 - 2 p·c + |c|^2，|p|^2 与 c 无关，最近的颜色只需一次矩阵乘法
+        #各项都是绝对值小于 2^24 的整数，float32 也能精确表示
+        palette = np.asarray([rgb for code, rgb in ANSI_16], dtype = np.float32)
+        rgb = np.stack([r, g, b], axis = -1).astype(np.float32)
+        scores = rgb @ (-2 * palette.T) + (palette ** 2).sum(axis = 1)
+        keys = scores.argmin(axis = 2)
+    if im.mode == 'RGBA':
+        keys = np.where(a[..., 3] == 0, -1, keys)
+    return keys
+
+#给字符画的各行加上颜色：只在颜色变化处输出转义序列，每行末尾恢复默认颜色
+#stats 不为 None 时累加 bytes（实际输出的字节数）和 naive_bytes（每个字符都带转义序列时的字节数）
+def colorize(im, rows, mode, stats = None):
+    band = color_keys(im, mode)
+    if np is not None and all(len(row) == im.size[0] for row in rows):
+        colored, naive = _colorize_array(rows, band, mode)
+    else:
+        colored, naive = _colorize_runs(rows, band, mode)
+    if stats is not None:
+        text = sum(len(row.encode('utf-8')) + len(RESET) + 1 for row in rows)
+        stats['naive_bytes'] = stats.get('naive_bytes', 0) + text + naive
+        stats['bytes'] = stats.get('bytes', 0) + sum(len(line.encode('utf-8')) + 1 for line in colored)
+    return colored
+
+#逐段拼接，没有 numpy 时使用
+#返回 (各行, 所有像素的转义序列的总长度)，后者即为逐字符输出转义序列时多出的字节数
+def _colorize_runs(rows, band, mode):
+    escapes = {}
+    colored = []
+    counts = collections.Counter()
+    for row, keys in zip(rows, band):
+        keys = list(keys)
+        counts.update(keys)
+        starts = [0] + [i for i in range(1, len(keys)) if keys[i] != keys[i - 1]]
+        parts = []
+        for start, end in zip(starts, starts[1:] + [len(row)]):
+            key = keys[start]
+            if key not in escapes:
+                escapes[key] = escape(mode, key)
+            parts.append(escapes[key])
+            parts.append(row[start:end])
+        parts.append(RESET)
+        colored.append(''.join(parts))
+    return colored, sum(len(escape(mode, key)) * count for key, count in counts.items())
+
+#字符串的各个字符的 Unicode 码位
+def _code_points(text):
+    return np.frombuffer(text.encode('utf-32-le'), dtype = np.uint32)
+
+#各调色板所有颜色编号（从 -1 开始）的转义序列的码位，按最长的长度补 0（NUL），每个字符占一列
+_escape_tables = {}
+
+def _escape_table(mode):
+    if mode not in _escape_tables:
+        escapes = [escape(mode, key) for key in range(-1, 256 if mode == '256' else len(ANSI_16))]
+        table = np.zeros((len(escapes), max(len(e) for e in escapes)), dtype = np.uint32)
+        for i, e in enumerate(escapes):
+            table[i, :len(e)] = _code_points(e)
+        _escape_tables[mode] = table
+    return _escape_tables[mode]
+
+#0 到 255 的十进制数字的码位，位数不足 3 位时前面补 0
+_DIGITS = None
+
+def _digits():
+    global _DIGITS
+    if _DIGITS is None:
+        value = np.arange(256)
+        _DIGITS = np.stack([np.where(value >= 100, 48 + value // 100, 0),
+                            np.where(value >= 10, 48 + value // 10 % 10, 0),
+                            48 + value % 10], axis = 1).astype(np.uint32)
+    return _DIGITS
+
+#各颜色编号的转义序列的码位；真彩色有 2^24 种颜色，直接由各分量的十进制数字拼出
+def _escape_codes(mode, keys):
+    if mode != 'truecolor':
+        return _escape_table(mode)[keys + 1]
+    digits = _digits()
+    codes = np.zeros((len(keys), 19), dtype = np.uint32)
+    codes[:, :7] = _code_points('\x1b[38;2;')
+    for i, shift in enumerate((16, 8, 0)):
+        codes[:, 7 + 4 * i:10 + 4 * i] = digits[(keys >> shift) & 255]
+        codes[:, 10 + 4 * i] = ord(';') if i < 2 else ord('m')
+    transparent = keys < 0
+    if transparent.any():
+        codes[transparent] = 0
+        codes[transparent, :5] = _code_points('\x1b[39m')
+    return codes
+
+#所有颜色编号的转义序列的总长度
+def _escape_length(mode, keys):
+    if mode != 'truecolor':
+        lengths = np.count_nonzero(_escape_table(mode), axis = 1)
+        return int(lengths[keys + 1].sum())
+    #真彩色的转义序列为 10 个固定字符加上三个分量的位数，透明像素为 5 个字符
+    width = np.count_nonzero(_digits(), axis = 1)
+    opaque = keys[keys >= 0]
+    total = 10 * len(opaque) + width[opaque >> 16].sum() + width[(opaque >> 8) & 255].sum() +\
+        width[opaque & 255].sum()
+    return int(total) + 5 * (len(keys) - len(opaque))
+
+#向量化拼接：在码位数组中每个字符前预留转义序列的位置，颜色不变处填 0；每行末尾接上 RESET 和换行符，
+#去掉所有 0 后整个条带一次解码为字符串，再按换行符分成各行。所有操作都在数组和字符串方法中完成
+#返回值与 _colorize_runs() 相同
+def _colorize_array(rows, band, mode):
+    height, width = band.shape
+    #逐字符输出转义序列时每个像素都需要一个转义序列
+    naive = _escape_length(mode, band.ravel())
+    #每行第一个字符以及颜色与左边不同的字符前需要转义序列
+    change = np.ones((height, width), dtype = bool)
+    change[:, 1:] = band[:, 1:] != band[:, :-1]
+    codes = _escape_codes(mode, band[change])
+    size = codes.shape[1]
+    tail = _code_points(RESET + '\n')
+    cells = np.zeros((height, width * (size + 1) + len(tail)), dtype = np.uint32)
+    body = cells[:, :width * (size + 1)].reshape(height, width, size + 1)
+    body[change, :size] = codes
+    body[..., size] = _code_points(''.join(rows)).reshape(height, width)
+    cells[:, width * (size + 1):] = tail
+    text = cells[cells != 0].tobytes().decode('utf-32-le')
+    return text.split('\n')[:-1], naive
+
+#彩色输出的字节数与逐字符输出转义序列时的比较
+def color_report(stats):
+    return '{} bytes written, {} bytes with an escape code per character ({:.1f}x smaller)'.format(
+        stats['bytes'], stats['naive_bytes'], stats['naive_bytes'] / float(stats['bytes'] or 1))
+
+#把图像转换为字符画，返回每行以换行符结尾的字符串
+#image 为 PIL 图像，RGB、RGBA（alpha 为 0 的像素输出空格）、L（灰度）以外的模式会先转换为 RGB 或 RGBA
+#charset 为从暗到亮排列的字符，默认为 ascii_char
+#color 为 COLOR_MODES 中的调色板时输出彩色字符画
+def image_to_ascii(image, width = 80, height = 80, charset = None, color = None):
+    im = prepare(image, width, height)
+    rows = ascii_rows(im, char_table(charset))
+    if color:
+        rows = colorize(im, rows, color)
+    #所有行一次拼接，避免 txt += 反复复制字符串
+    return '\n'.join(rows) + '\n'
+
+#######################################逐行输出#######################################
+
+#每次缩放和转换的字符画行数
+BAND_ROWS = 64
+
+#缩放到 height 行时每一行取自原图的哪一行，由 PIL 自己缩放一列行号得到，与 resize() 的取整完全一致
+def _nearest_rows(source_height, height):
+    index = Image.new('I', (1, source_height))
+    index.frombytes(array('i', range(source_height)).tobytes())
+    return array('i', index.resize((1, height), Image.NEAREST).tobytes()).tolist()
+
+#依次生成字符画的每一行（不含换行符），结果与 image_to_ascii() 完全相同
+#每次只取出 band 行需要的原图行并缩放，临时数据的大小与 band 而不是字符画的高度成正比
+#color 为 COLOR_MODES 中的调色板时输出彩色字符画，stats 见 colorize()
+def iter_ascii_rows(image, width = 80, height = 80, charset = None, band = BAND_ROWS, color = None,
+                    stats = None):
+    table = char_table(charset)
+    image.load()
+    source_width = image.size[0]
+    sources = _nearest_rows(image.size[1], height)
+    for top in range(0, height, band):
+        rows = sources[top:top + band]
+        im = Image.new(image.mode, (width, len(rows)))
+        if image.mode in ('P', 'PA'):
+            im.putpalette(image.getpalette())
+        im.info.update(image.info)
+        #横向缩放只与宽度有关，逐行缩放与整幅缩放得到的像素相同
+        for y, source in enumerate(rows):
+            line = image.crop((0, source, source_width, source + 1))
+            im.paste(line.resize((width, 1), Image.NEAREST), (0, y))
+        im = _convert(im)
+        rows = ascii_rows(im, table)
+        if color:
+            rows = colorize(im, rows, color, stats)
+        for row in rows:
+            yield row
+
+#把各行写入所有文件对象，每行只生成一次；返回写入的行数
+def write_rows(rows, outs):
+    count = 0
+    for row in rows:
+        line = row + '\n'
+        for f in outs:
+            f.write(line)
+        count += 1
+    return count
+
+#######################################动画播放#######################################
+
+#按文件名中的数字排序，frame2.png 排在 frame10.png 之前
+def _natural_key(name):
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+#依次生成 (帧图像, 显示时长（秒）或 None)
+#source 为动画 GIF/WebP 等多帧图像文件，或者是按编号命名的帧图像所在的目录
+def iter_frames(source):
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source), key = _natural_key):
+            path = os.path.join(source, name)
+            if os.path.isfile(path):
+                with Image.open(path) as im:
+                    im.load()
+                    yield im, None
+        return
+    with Image.open(source) as im:
+        for index in range(getattr(im, 'n_frames', 1)):
+            im.seek(index)
+            duration = im.info.get('duration')
+            yield im, duration / 1000.0 if duration else None
+
+#生产者线程：解码和缩放每一帧，放入队列；队列满时等待，stop 被设置时退出
+def _produce(source, width, height, loop, frames, stop):
+    try:
+        while not stop.is_set():
+            for image, duration in iter_frames(source):
+                item = (prepare(image, width, height), duration)
+                while not stop.is_set():
+                    try:
+                        frames.put(item, timeout = 0.1)
+                        break
+                    except queue.Full:
+                        pass
+                if stop.is_set():
+                    return
+            if not loop:
+                break
+        frames.put(None)
+    except Exception as e:
+        frames.put(e)
+
+#以 fps 帧每秒在终端播放字符画动画，返回统计 {"frames", "shown", "dropped", "elapsed", "fps"}
+#fps 为 None 时按图像中记录的每帧时长播放，没有记录时为每秒 30 帧
+#解码和缩放在生产者线程中进行，渲染和输出在当前线程；渲染落后时丢弃已经过时的帧，只重绘有变化的行
+#color 为 COLOR_MODES 中的调色板时播放彩色字符画
+def play(source, width = 80, height = 40, fps = None, charset = None, loop = False, out = None,
+         color = None):
+    out = out or sys.stdout
+    table = char_table(charset)
+    frames = queue.Queue(maxsize = 8)
+    stop = threading.Event()
+    producer = threading.Thread(target = _produce, args = (source, width, height, loop, frames, stop))
+    producer.daemon = True
+    producer.start()
+
+    previous = [None] * height
+    count = shown = dropped = 0
+    #隐藏光标并清屏
+    out.write('\x1b[?25l\x1b[2J')
+    start = due = time.perf_counter()
+    try:
+        while True:
+            item = frames.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            im, duration = item
+            count += 1
+            interval = 1.0 / fps if fps else (duration or 1.0 / 30)
+            now = time.perf_counter()
+            #这一帧的显示时间已经过去，下一帧也该显示了，并且下一帧已经准备好时才丢弃这一帧
+            if now > due + interval:
+                if not frames.empty():
+                    dropped += 1
+                    due += interval
+                    continue
+                #解码比目标帧率慢时没有更新的帧可以代替，仍然显示这一帧，并从现在开始重新计时
+                due = now
+            rows = ascii_rows(im, table)
+            if color:
+                rows = colorize(im, rows, color)
+            #只输出有变化的行，用光标控制码移动到该行开头
+            parts = ['\x1b[{};1H{}'.format(i + 1, row) for i, row in enumerate(rows) if row != previous[i]]
+            previous = rows
+            if now < due:
+                time.sleep(due - now)
+            out.write(''.join(parts))
+            out.flush()
+            shown += 1
+            due += interval
+    #Ctrl-C 是停止循环播放的唯一方式，通常发生在等待下一帧时，正常结束并返回统计
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        #把光标移到动画下方并恢复显示
+        out.write('\x1b[{};1H\x1b[?25h'.format(height + 1))
+        out.flush()
+    elapsed = time.perf_counter() - start
+    return {'frames': count, 'shown': shown, 'dropped': dropped, 'elapsed': elapsed,
+            'fps': shown / elapsed if elapsed else 0.0}
+
+#######################################批量转换#######################################
+
+#批量转换时默认的输出路径模板：与源文件同目录、同名的 .txt 文件
+OUTPUT_TEMPLATE = '{dir}/{name}.txt'
+
+#批量转换时从目录中收集的图像扩展名
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp', '.tif', '.tiff')
+
+#依次产生 paths 中的文件，目录按文件名顺序递归遍历，只收集扩展名在 IMAGE_EXTENSIONS 中的文件
+def iter_images(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+#由模板得到输出路径，可用的字段：dir 源文件所在目录，name 不含扩展名的文件名，ext 扩展名（不含点），
+#width 和 height 为字符画的宽和高
+def output_path(template, source, width, height):
+    directory, filename = os.path.split(source)
+    name, ext = os.path.splitext(filename)
+    return template.format(dir = directory or '.', name = name, ext = ext[1:], width = width, height = height)
+
+#记录输出文件生成参数的隐藏文件，与输出文件在同一目录
+def settings_path(output):
+    directory, filename = os.path.split(output)
+    return os.path.join(directory, '.{}.settings'.format(filename))
+
+#读取输出文件的生成参数，不存在或无法解析时返回 None
+def read_settings(output):
+    try:
+        with open(settings_path(output)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+#在工作进程中转换一个文件，返回结果字典；status 为 converted、skipped 或 error
+def convert_file(task):
+    source, output, width, height, charset, force, color = task
+    record = {'file': source, 'output': output, 'status': 'converted', 'elapsed': 0.0}
+    settings = {'width': width, 'height': height, 'charset': charset, 'color': color}
+    start = time.perf_counter()
+    try:
+        #输出文件比源文件新、并且是用同样的参数生成的时跳过
+        if not force and os.path.exists(output) and os.path.getmtime(output) >= os.path.getmtime(source) \
+                and read_settings(output) == settings:
+            record['status'] = 'skipped'
+            return record
+        directory = os.path.dirname(output)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+        #先写入临时文件再改名，中断时不会留下不完整、却比源文件新的输出文件
+        temp = '{}.{}.tmp'.format(output, os.getpid())
+        try:
+            with Image.open(source) as im, open(temp, 'w', buffering = 1 << 16) as f:
+                stats = {}
+                rows = iter_ascii_rows(im, width, height, charset, color = color, stats = stats)
+                record['rows'] = write_rows(rows, [f])
+            record.update(stats)
+            os.replace(temp, output)
+            with open(settings_path(output), 'w') as f:
+                json.dump(settings, f)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+        record['bytes'] = os.path.getsize(source)
+    except Exception as e:
+        record['status'] = 'error'
+        record['error'] = '{}: {}'.format(type(e).__name__, e)
+    record['elapsed'] = time.perf_counter() - start
+    return record
+
+#使用进程池并行转换 paths 中的文件和目录（递归查找图像文件），按完成顺序逐个产生 convert_file() 的结果
+#jobs 为进程数，缺省时为 CPU 核数；jobs 为 1 时直接在当前进程中转换
+#force 为 True 时不跳过已经是最新的输出文件；color 见 iter_ascii_rows()
+#多个源文件对应同一个输出路径时，只转换第一个
+def batch_convert(paths, template = OUTPUT_TEMPLATE, width = 80, height = 80, charset = None,
+                  jobs = None, force = False, color = None):
+    tasks, outputs = [], {}
+    for source in iter_images(paths):
+        output = output_path(template, source, width, height)
+        if output in outputs:
+            yield {'file': source, 'output': output, 'status': 'error', 'elapsed': 0.0,
+                   'error': 'Output path already used by {}'.format(outputs[output])}
+            continue
+        outputs[output] = source
+        tasks.append((source, output, width, height, charset, force, color))
+    if jobs == 1:
+        for task in tasks:
+            yield convert_file(task)
+        return
+    from multiprocessing import Pool
+    with Pool(jobs) as pool:
+        for record in pool.imap_unordered(convert_file, tasks):
+            yield record
+
+def main(argv = None):
+    #####################################################################################################
+    ##python argparse宏包学习
+    ##使用argparse第一步是创建一个解析器对象，并告诉其参数；解析器类为ArgumentParser，如：
+    ##parser = argparse.ArgumentParse(description = "This is a example program") %description用途描述函数
+    ##add_argument()方法，用于接受程序需要接受的命令参数
+    ##一般语法：parser.add_argument('-shorname', '--fullname', type = ?, default = ?) %参数数量可选
+    ##注意：shortname前只需'-',对于fullname需要'--'
+    ##parser.add_argument('para') %这种格式是最简单的，且para这个参数是必须的
+    ##parser.add_argument()方法具有
+    ##dest：如果提供dest，例如dest="a"，那么可以通过args.a访问该参数
+    ##default：设置参数的默认值
+    ##action：参数出发的动作
+    ##store：保存参数，默认
+    ##store_const：保存一个被定义为参数规格一部分的值（常量），而不是一个来自参数解析而来的值
+    ##store_ture/store_false：保存相应的布尔值
+    ##append：将值保存在一个列表中
+    ##append_const：将一个定义在参数规格中的值（常量）保存在一个列表中
+    ##count：参数出现的次数:parser.add_argument("-v", "--verbosity", action="count",
+    # default=0, help="increase output verbosity")
+    ##version：打印程序版本信息
+    ##type：把从命令行输入的结果转成设置的类型
+    ##choice：允许的参数值:parser.add_argument("-v", "--verbosity", type=int,
+    # choices=[0, 1, 2], help="increase output verbosity")
+    ##help：参数命令的介绍
+    ##parse_args()返回值是一个命名空间，用于获取参数值
+    ##################################################################################################
+    parser = argparse.ArgumentParser(description = 'Convert an image to ASCII art')
+
+    parser.add_argument('file', nargs = '+') #输入文件，批量转换时可以是多个文件或目录
+    parser.add_argument('-o', '--output') #输出文件
+    parser.add_argument('--width', type = int, default = 80) #输出字符画宽
+    parser.add_argument('--height', type = int, default = 80) #输出字符画高
+    parser.add_argument('-n', '--no-echo', action = 'store_true',
+                        help = 'Only write the output file, do not print to the terminal') #不输出到终端
+    parser.add_argument('-p', '--play', action = 'store_true',
+                        help = 'Play an animated GIF/WebP or a directory of numbered frames') #播放动画
+    parser.add_argument('--fps', type = float,
+                        help = 'Frames per second when playing (default: the frame durations, or 30)')
+    parser.add_argument('--loop', action = 'store_true', help = 'Repeat the animation until interrupted')
+    parser.add_argument('-b', '--batch', action = 'store_true',
+                        help = 'Convert many files or directories in parallel') #批量转换
+    parser.add_argument('-t', '--template', default = OUTPUT_TEMPLATE,
+                        help = 'Output path template in batch mode, fields: {dir} {name} {ext} {width} '
+                        '{height} (default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type = int, help = 'Number of worker processes in batch mode '
+                        '(default: number of CPUs)')
+    parser.add_argument('-f', '--force', action = 'store_true',
+                        help = 'Convert even when the output is newer than the source and was '
+                        'made with the same settings')
+    parser.add_argument('-c', '--color', choices = COLOR_MODES,
+                        help = 'Colour the characters with ANSI escape codes from this palette') #彩色输出
+
+    args = parser.parse_args(argv) #用于获取参数
+
+    if args.batch:
+        if args.output:
+            parser.error('use --template instead of --output in batch mode')
+        start = time.perf_counter()
+        counts = {'converted': 0, 'skipped': 0, 'error': 0}
+        total_bytes = 0
+        output_bytes = {'bytes': 0, 'naive_bytes': 0}
+        for record in batch_convert(args.file, args.template, args.width, args.height,
+                                    jobs = args.jobs, force = args.force, color = args.color):
+            counts[record['status']] += 1
+            total_bytes += record.get('bytes', 0)
+            for key in output_bytes:
+                output_bytes[key] += record.get(key, 0)
+            line = '{status:<9} {elapsed:8.3f}s  {file} -> {output}'.format(**record)
+            if 'error' in record:
+                line += '  ({})'.format(record['error'])
+            print(line)
+        elapsed = time.perf_counter() - start
+        print('{converted} converted, {skipped} skipped, {error} failed'.format(**counts) +
+              ' in {:.2f}s ({:.1f} files/s, {:.1f} MB/s of source images)'.format(
+                  elapsed, counts['converted'] / elapsed, total_bytes / elapsed / 1e6))
+        if args.color and counts['converted']:
+            print(color_report(output_bytes))
+        return 1 if counts['error'] else 0
+
+    if len(args.file) > 1:
+        parser.error('only one file is allowed without --batch')
+    args.file = args.file[0]
+
+    if args.play:
+        stats = play(args.file, args.width, args.height, args.fps, loop = args.loop, color = args.color)
+        #实际达到的帧率输出到标准错误，不影响终端中的画面
+        sys.stderr.write('{shown} of {frames} frames shown, {dropped} dropped, {fps:.1f} fps\n'.format(**stats))
+        return
+
+    #逐行生成字符画，每行生成后立即写入文件和终端，不在内存中保存整幅字符画
+    #字符画输出到文件，未指定时输出到 output.txt
+    #with 语句保证文件被关闭，缓存在内存中的数据会全部写入磁盘
+    stats = {}
+    rows = iter_ascii_rows(Image.open(args.file), args.width, args.height, color = args.color, stats = stats)
+    with open(args.output or 'output.txt', 'w', buffering = 1 << 16) as f:
+        outs = [f] if args.no_echo else [f, sys.stdout]
+        write_rows(rows, outs)
+    if not args.no_echo:
+        #与 print() 输出整幅字符画时一样，最后多一个空行
+        sys.stdout.write('\n')
+    if args.color:
+        sys.stdout.flush()
+        sys.stderr.write(color_report(stats) + '\n')
+
 if __name__ == '__main__': #__name__ 是当前模块名，当模块被直接运行时模块名为 __main__
                            # 这句话的意思就是，当模块被直接运行时，以下代码块将被运行，当模块是被导入时，代码块不被运行
-    im = Image.open(IMG)
-    im = im.resize((WIDTH, HEIGHT), Image.NEAREST)  #resize(seze, filter)，size具有（width，height两个参数）；filter
-                                                    #具有四个参数，NEAREST指此时选择最近的对象
-    txt = ''
-    for i in range(HEIGHT):
-        for j in range(WIDTH):
-            txt += get_char(*im.getpixel((j,i))) #im.getpixel()返回的是一个元组，这个元组有三个元素，分别对应三个颜色通道(RGB)的值
-                                                 #'*'是一个运算符，对元组使用'*'运算符即为对元组拆封操作，元组拆封会返回元组所有元素
-                                                 #'*im.getpixel()'返回的三个值，正好对应get_char()函数的前三个参数
-                                                 #'getpixel()'函数返回值由图片颜色模式决定，RGB:3元素组；RGBA:4元素组；Gray：int值
-                                                 #此处是4元素组，当图片处于空白区域时，alpha=0
-        txt += '\n'
-    print(txt)
-
-#字符画输出到文件
-if OUTPUT:
-    with open(OUTPUT, 'w') as f:
-        f.write(txt)    #你可以反复调用write()来写入文件，但是务必要调用f.close()来关闭文件。当我们写文件时，
-                        # 操作系统往往不会立刻把数据写入磁盘，而是放到内存缓存起来，空闲的时候再慢慢写入。只有调用close()方法时，
-                        # 操作系统才保证把没有写入的数据全部写入磁盘。忘记调用close()的后果是数据可能只写了一部分到磁盘，
-                        #剩下的丢失了。所以，还是用with语句来得保险
-else:
-    with open("output.txt", 'w') as f:
-        f.write(txt)
\ No newline at end of file
+    sys.exit(main())
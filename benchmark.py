@@ -0,0 +1,241 @@
+# 性能基准测试
+# 1.生成确定的合成图像：0.1、1、4、12 百万像素，肤色面积比例和皮肤区域个数可控
+# 2.分别测量 Nude.resize、Nude.parse、showSkinRegions 以及 ascii.image_to_ascii 生成字符画的耗时，
+#   并比较分别运行检测和字符画（各自解码一次）与共用一次解码（Nude.preview）的总耗时
+# 3.输出耗时、每秒处理像素数和峰值内存，结果保存为 JSON，并可与基准结果比较，超过阈值即视为性能退化
+
+# 每个测试项都在单独的子进程中运行，这样峰值内存（ru_maxrss）只反映该测试项本身
+# 只依赖标准库和 PIL，无需联网
+
+import sys
+import os
+import json
+import math
+import time
+import random
+import resource
+import statistics
+import subprocess
+import tempfile
+from PIL import Image, ImageDraw
+
+# 脚本所在目录，Nude_jpg.py 和 ascii.py 都在这里
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# 合成图像的尺寸（百万像素），宽高比为 4:3
+SIZES = (0.1, 1, 4, 12)
+
+# 场景名称: (肤色面积比例, 皮肤区域个数)
+SCENARIOS = {
+    "skin30": (0.30, 4),
+    "skin5": (0.05, 40),
+}
+
+# 字符画的宽和高
+ASCII_SIZES = ((80, 40), (160, 60), (320, 120))
+
+# 测试项
+KINDS = ("resize", "parse", "parse_streaming", "parse_early_exit", "parse_pyramid", "visualize",
+         "ascii", "separate", "combined")
+
+# 肤色和背景颜色，分别满足和不满足 YCbCr 肤色判定
+SKIN_COLOR = (220, 170, 140)
+BACKGROUND_COLOR = (40, 90, 200)
+
+
+def image_size(megapixels):
+    width = int(round(math.sqrt(megapixels * 1e6 * 4 / 3)))
+    return width, int(round(megapixels * 1e6 / width))
+
+
+def make_image(megapixels, coverage, regions, seed=0):
+    """
+    生成合成图像：在背景上按网格放置 regions 个互不相连的方形肤色区域，总面积约为 coverage
+    同样的参数总是得到同样的图像
+    """
+    width, height = image_size(megapixels)
+    image = Image.new("RGB", (width, height), BACKGROUND_COLOR)
+    draw = ImageDraw.Draw(image)
+    rng = random.Random(seed)
+    # 网格的每个格子里放一个区域，区域之间至少隔开一个像素
+    columns = int(math.ceil(math.sqrt(regions * width / height)))
+    rows = int(math.ceil(regions / columns))
+    cell_w, cell_h = width // columns, height // rows
+    side = int(math.sqrt(coverage * width * height / regions))
+    side_w, side_h = min(side, cell_w - 2), min(side, cell_h - 2)
+    for index in range(regions):
+        left = (index % columns) * cell_w + rng.randint(1, max(1, cell_w - side_w - 1))
+        top = (index // columns) * cell_h + rng.randint(1, max(1, cell_h - side_h - 1))
+        draw.rectangle((left, top, left + side_w - 1, top + side_h - 1), fill=SKIN_COLOR)
+    return image
+
+
+def case_key(case):
+    key = "{kind}/{size}MP/{scenario}".format(**case)
+    if case["kind"] == "ascii":
+        key += "/{}x{}".format(case["width"], case["height"])
+    return key
+
+
+def _timed(repeat, setup, func):
+    # setup 的耗时不计入结果
+    times = []
+    for _ in range(repeat):
+        arg = setup()
+        start = time.perf_counter()
+        func(arg)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def run_case(case):
+    """在当前（子）进程中运行一个测试项，返回结果字典"""
+    sys.path.insert(0, ROOT)
+    from Nude_jpg import Nude
+
+    path, kind, repeat = case["path"], case["kind"], case["repeat"]
+    extra = {}
+
+    def opened():
+        n = Nude(path)
+        n.image.load()
+        return n
+
+    def parsed():
+        return opened().parse()
+
+    if kind == "resize":
+        # 包含解码的耗时，缩小到一半以保证各种尺寸都会真正缩放
+        times = _timed(repeat, lambda: Nude(path),
+                       lambda n: n.resize(maxwidth=n.width // 2, maxheight=n.height // 2))
+    elif kind == "parse":
+        times = _timed(repeat, opened, lambda n: n.parse())
+    elif kind == "parse_streaming":
+        times = _timed(repeat, opened, lambda n: n.parse(streaming=True))
+    elif kind == "parse_early_exit":
+        times = _timed(repeat, opened, lambda n: n.parse(early_exit=True))
+    elif kind == "parse_pyramid":
+        times = _timed(repeat, opened, lambda n: n.parse_pyramid())
+        # 与原图解析结果比较，记录金字塔得出结果的缩小倍数以及结果是否一致
+        n = opened().parse_pyramid()
+        extra = {"level": n.pyramid_level, "agrees": n.result == parsed().result}
+    elif kind == "visualize":
+        out = os.path.join(case["workdir"], "regions.png")
+        times = _timed(repeat, parsed, lambda n: n.showSkinRegions(path=out))
+    elif kind == "ascii":
+        # 包含解码的耗时
+        from ascii import image_to_ascii
+        times = _timed(repeat, lambda: Image.open(path),
+                       lambda im: image_to_ascii(im, case["width"], case["height"]))
+    elif kind in ("separate", "combined"):
+        # 都包含解码的耗时：separate 中检测和字符画各自打开、解码图像，combined 共用缩小后的图像
+        from ascii import image_to_ascii
+
+        def separate(_):
+            n = Nude(path)
+            n.resize()
+            n.parse()
+            image_to_ascii(Image.open(path), 80, 40)
+
+        def combined(_):
+            n = Nude(path)
+            n.resize()
+            n.parse()
+            n.preview(80, 40)
+
+        times = _timed(repeat, lambda: None, separate if kind == "separate" else combined)
+    else:
+        raise ValueError("Unknown benchmark kind: {}".format(kind))
+
+    width, height = image_size(case["size"])
+    pixels = case["width"] * case["height"] if kind == "ascii" else width * height
+    # ru_maxrss 在 Linux 上的单位是 KB
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+              resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    result = {
+        "key": case_key(case),
+        "wall": min(times),
+        "median": statistics.median(times),
+        "pixels_per_sec": pixels / min(times) if min(times) else None,
+        "peak_rss_mb": round(rss / 1024.0, 1),
+    }
+    result.update(extra)
+    return result
+
+
+def run_isolated(case):
+    # 在新的解释器中运行测试项
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), "--case", json.dumps(case)],
+                            stdout=subprocess.PIPE, check=True).stdout
+    return json.loads(output.decode())
+
+
+def compare(results, baseline, threshold):
+    """返回耗时比基准结果增加超过 threshold（比例）的测试项 [(key, 基准耗时, 当前耗时)]"""
+    old = dict((r["key"], r["wall"]) for r in baseline["results"])
+    regressions = []
+    for r in results:
+        if r["key"] in old and r["wall"] > old[r["key"]] * (1 + threshold):
+            regressions.append((r["key"], old[r["key"]], r["wall"]))
+    return regressions
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark Nude_jpg.py and ascii.py')
+    parser.add_argument('--sizes', type=float, nargs='+', default=SIZES,
+                        help='Image sizes in megapixels (default: 0.1 1 4 12)')
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=sorted(SCENARIOS),
+                        help='Skin coverage scenarios to run')
+    parser.add_argument('--kinds', nargs='+', choices=KINDS, default=KINDS, help='What to time')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per case, the fastest is kept')
+    parser.add_argument('-o', '--output', help='Write results as JSON to this file')
+    parser.add_argument('--baseline', help='Compare with results previously written by --output')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Allowed slowdown against the baseline (default: 0.2 = 20%%)')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(json.loads(args.case))))
+        return 0
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            for scenario in args.scenarios:
+                coverage, regions = SCENARIOS[scenario]
+                path = os.path.join(workdir, "{}MP-{}.jpg".format(size, scenario))
+                make_image(size, coverage, regions).save(path, quality=95)
+                for kind in args.kinds:
+                    case = {"kind": kind, "size": size, "scenario": scenario, "path": path,
+                            "repeat": args.repeat, "workdir": workdir}
+                    for width, height in (ASCII_SIZES if kind == "ascii" else [(None, None)]):
+                        case.update(width=width, height=height)
+                        result = run_isolated(case)
+                        results.append(result)
+                        line = "{key:<40} {wall:>9.4f}s {pps:>14} px/s {peak_rss_mb:>8} MB".format(
+                            pps="{:.0f}".format(result["pixels_per_sec"] or 0), **result)
+                        if "agrees" in result:
+                            line += "  level {level} agrees {agrees}".format(**result)
+                        print(line)
+                        sys.stdout.flush()
+
+    report = {"python": sys.version.split()[0], "platform": sys.platform,
+              "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for key, old, new in regressions:
+            print("REGRESSION {}: {:.4f}s -> {:.4f}s ({:+.0f}%)".format(key, old, new, (new / old - 1) * 100))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
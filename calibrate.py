@@ -0,0 +1,298 @@
+# 判定阈值校准
+# 1.并行解析带标注的本地图片集，每张图片只保存从大到小排列的皮肤区域像素数和总像素数（见 Nude.region_summary()）
+# 2.在阈值网格上逐一重新判定所有图片，无需重新解析，并统计每组阈值的准确率（precision）和召回率（recall）
+
+# 图片集的标注方式：--nude 目录中的图片为色情图片，--safe 目录中的图片不是
+# 解析得到的汇总可以用 --summaries 保存，之后换一组网格再次校准时直接读取，不必重新解析
+
+# 有 numpy 时按图片向量化判定：对每个 min_region_size 先求出各图片保留的区域个数、皮肤比例和最大区域占比，
+# 其余四个阈值的每种组合只需几次数组比较，数千组阈值乘以数千张图片只需几秒
+
+import sys
+import os
+import json
+import bisect
+import itertools
+from multiprocessing import Pool
+
+from Nude_jpg import Nude, Thresholds, iter_images, judge, np
+
+# 网格参数的名称和对应的命令行选项
+GRID_OPTIONS = (
+    ("min_region_size", "--min-size"),
+    ("min_regions", "--min-regions"),
+    ("skin_percent", "--skin-percent"),
+    ("largest_percent", "--largest-percent"),
+    ("max_regions", "--max-regions"),
+)
+
+
+def parse_values(text):
+    """
+    解析网格取值：逗号分隔的数值，或 start:stop:step 表示的范围（包含 stop）
+    例如 "10,20,30" 或 "10:50:5"
+    """
+    values = []
+    for part in text.split(","):
+        if ":" in part:
+            start, stop, step = [float(x) for x in part.split(":")]
+            if step <= 0:
+                raise ValueError("Range step must be positive: {}".format(part))
+            count = int(round((stop - start) / step))
+            values.extend(start + step * i for i in range(count + 1))
+        else:
+            values.append(float(part))
+    # 整数值保存为 int，使得输出更整洁
+    return sorted(set(int(v) if v == int(v) else v for v in values))
+
+
+def summarize(args):
+    """在工作进程中解析一张图片，返回 (路径, 汇总, 错误)"""
+    fname, options = args
+    try:
+        n = Nude(fname, classifiers=options["classifiers"], connectivity=options["connectivity"])
+        if options["resize"]:
+            n.resize()
+        n.parse()
+        return fname, n.region_summary(options["floor"]), None
+    except Exception as e:
+        return fname, None, "{}: {}".format(type(e).__name__, e)
+
+
+def load_summaries(path):
+    """读取 --summaries 文件，返回 {(路径, 选项): 汇总}"""
+    summaries = {}
+    if path and os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                record = json.loads(line)
+                summaries[(record["file"], record["options"])] = record
+    return summaries
+
+
+def collect(labeled, options, jobs, path=None):
+    """
+    解析所有图片，返回 [(label, 汇总)]
+    labeled 为 [(路径, label)]；path 中已有的、文件未修改过的汇总直接使用，新的汇总追加到 path
+    """
+    key = json.dumps(options, sort_keys=True)
+    known = load_summaries(path)
+    results, missing = {}, []
+    for fname, label in labeled:
+        stat = os.stat(fname)
+        record = known.get((fname, key))
+        if record is not None and record["mtime"] == stat.st_mtime and record["size"] == stat.st_size:
+            results[fname] = record["summary"]
+        else:
+            missing.append(fname)
+
+    if missing:
+        out = open(path, "a") if path else None
+        with Pool(jobs) as pool:
+            for fname, summary, error in pool.imap_unordered(
+                    summarize, [(fname, options) for fname in missing], chunksize=4):
+                if error is not None:
+                    sys.stderr.write("{}: {}\n".format(fname, error))
+                    continue
+                results[fname] = summary
+                if out is not None:
+                    stat = os.stat(fname)
+                    out.write(json.dumps({"file": fname, "options": key, "mtime": stat.st_mtime,
+                                          "size": stat.st_size, "summary": summary}) + "\n")
+        if out is not None:
+            out.close()
+    return [(label, results[fname]) for fname, label in labeled if fname in results]
+
+
+class Corpus(object):
+    """
+    所有图片的汇总，按 min_region_size 预先算出每张图片保留的区域个数、皮肤总像素数和最大区域像素数
+    """
+
+    def __init__(self, items):
+        self.labels = [label for label, summary in items]
+        self.totals = [summary["total_pixels"] for label, summary in items]
+        # 从小到大排列的区域像素数及其后缀和，用二分查找求出大于某个值的区域个数和像素数之和
+        self.ascending = []
+        self.suffix = []
+        for label, summary in items:
+            sizes = summary["sizes"][::-1]
+            suffix = [0] * (len(sizes) + 1)
+            for i in range(len(sizes) - 1, -1, -1):
+                suffix[i] = suffix[i + 1] + sizes[i]
+            self.ascending.append(sizes)
+            self.suffix.append(suffix)
+        self._kept = {}
+
+    def kept(self, min_size):
+        """每张图片在 min_size 下保留的 (区域个数, 皮肤总像素数, 最大区域像素数)"""
+        if min_size not in self._kept:
+            kept = []
+            for sizes, suffix in zip(self.ascending, self.suffix):
+                i = bisect.bisect_right(sizes, min_size)
+                kept.append((len(sizes) - i, float(suffix[i]), sizes[-1] if i < len(sizes) else 0))
+            self._kept[min_size] = kept
+        return self._kept[min_size]
+
+
+# 向量化判定时每批的 阈值组合数 * 图片数 上限，限制临时布尔数组的大小
+BATCH_CELLS = 1 << 22
+
+# 工作进程中的 Corpus，由 _init_worker() 设置，避免每个任务都传送所有汇总
+_corpus = None
+
+
+def _init_worker(items):
+    global _corpus
+    _corpus = Corpus(items)
+
+
+def _score(predicted, labels):
+    tp = sum(1 for p, l in zip(predicted, labels) if p and l)
+    fp = sum(1 for p, l in zip(predicted, labels) if p and not l)
+    fn = sum(1 for p, l in zip(predicted, labels) if not p and l)
+    return tp, fp, fn, len(labels) - tp - fp - fn
+
+
+def evaluate_grid(task):
+    """
+    在工作进程中判定一个 min_region_size 下的所有阈值组合
+    task 为 (min_region_size, [(min_regions, skin_percent, largest_percent, max_regions), ...])
+    返回 [(Thresholds, tp, fp, fn, tn)]
+    """
+    min_size, combos = task
+    kept = _corpus.kept(min_size)
+    labels = _corpus.labels
+    rows = []
+    if np is not None:
+        # 与 judge() 使用相同的运算顺序，结果完全一致
+        count = np.array([k[0] for k in kept], dtype=np.float64)
+        total = np.array([k[1] for k in kept], dtype=np.float64)
+        largest = np.array([k[2] for k in kept], dtype=np.float64)
+        skin = total / np.array(_corpus.totals, dtype=np.float64) * 100
+        with np.errstate(divide="ignore", invalid="ignore"):
+            share = np.where(total > 0, largest / total * 100, 0)
+        truth = np.array(labels, dtype=bool)
+        # 一次判定一批阈值组合：每行为一组阈值，每列为一张图片
+        step = max(1, BATCH_CELLS // max(1, len(labels)))
+        for i in range(0, len(combos), step):
+            batch = combos[i:i + step]
+            grid = np.array(batch, dtype=np.float64)
+            predicted = ((count >= grid[:, 0:1]) & (skin >= grid[:, 1:2]) &
+                         (share >= grid[:, 2:3]) & (count <= grid[:, 3:4]))
+            positive = np.count_nonzero(predicted, axis=1)
+            tp = np.count_nonzero(predicted & truth, axis=1)
+            fn = int(np.count_nonzero(truth)) - tp
+            for combo, t, p, f in zip(batch, tp.tolist(), positive.tolist(), fn.tolist()):
+                rows.append((Thresholds(min_size, *combo), t, p - t, f, len(labels) - p - f))
+        return rows
+
+    for combo in combos:
+        thresholds = Thresholds(min_size, *combo)
+        predicted = [judge(c, t, g, p, thresholds)[0] for (c, t, g), p in zip(kept, _corpus.totals)]
+        rows.append((thresholds,) + _score(predicted, labels))
+    return rows
+
+
+def sweep(items, grid, jobs=None):
+    """
+    items 为 [(label, 汇总)]，grid 为 {阈值名称: [取值]}
+    返回所有阈值组合的 [(Thresholds, tp, fp, fn, tn)]
+    """
+    floor = max([summary["floor"] for label, summary in items] or [0])
+    if min(grid["min_region_size"]) < floor:
+        raise ValueError("Summaries only keep regions larger than {}, use --floor to parse "
+                         "again".format(floor))
+    combos = list(itertools.product(grid["min_regions"], grid["skin_percent"],
+                                    grid["largest_percent"], grid["max_regions"]))
+    # 按 min_region_size 和组合分块，使每个工作进程都有足够的任务
+    step = max(1, len(combos) // 4)
+    tasks = [(min_size, combos[i:i + step]) for min_size in grid["min_region_size"]
+             for i in range(0, len(combos), step)]
+    if jobs == 1:
+        _init_worker(items)
+        return [row for task in tasks for row in evaluate_grid(task)]
+    with Pool(jobs, initializer=_init_worker, initargs=(items,)) as pool:
+        return [row for rows in pool.imap(evaluate_grid, tasks) for row in rows]
+
+
+def metrics(tp, fp, fn, tn):
+    precision = tp / float(tp + fp) if tp + fp else 0.0
+    recall = tp / float(tp + fn) if tp + fn else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return precision, recall, f1
+
+
+def main():
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description='Sweep Nude decision thresholds over a labeled '
+                                     'image corpus and report precision and recall')
+    parser.add_argument('--nude', action='append', default=[], metavar='DIR',
+                        help='Directory of images labeled nude, can be given several times')
+    parser.add_argument('--safe', action='append', default=[], metavar='DIR',
+                        help='Directory of images labeled not nude, can be given several times')
+    parser.add_argument('--summaries', metavar='PATH', help='Reuse and append per-image region '
+                        'summaries in this JSONL file')
+    parser.add_argument('-r', '--resize', action='store_true', help='Reduce image size before '
+                        'parsing')
+    parser.add_argument('-c', '--classifier', action='append', choices=Nude.CLASSIFIERS,
+                        help='Skin classifier to combine, can be given several times '
+                        '(default: ycbcr)')
+    parser.add_argument('--connectivity', type=int, choices=(4, 8), default=8,
+                        help='Pixel connectivity used to build skin regions (default: 8)')
+    parser.add_argument('--floor', type=int, default=0, help='Drop regions of at most this many '
+                        'pixels from the summaries (default: 0, keep all)')
+    default = Nude.THRESHOLDS
+    for name, option in GRID_OPTIONS:
+        parser.add_argument(option, dest=name, type=parse_values, default=[getattr(default, name)],
+                            help='Values to try, "a,b,c" or "start:stop:step" '
+                            '(default: {})'.format(getattr(default, name)))
+    parser.add_argument('-j', '--jobs', type=int, help='Number of worker processes '
+                        '(default: number of CPUs)')
+    parser.add_argument('-s', '--sort', choices=('f1', 'precision', 'recall'), default='f1',
+                        help='Order of the report (default: f1)')
+    parser.add_argument('-n', '--top', type=int, default=20, help='Settings to print (default: 20)')
+    parser.add_argument('-o', '--output', help='Write every setting as CSV to this file')
+    args = parser.parse_args()
+
+    labeled = [(fname, True) for fname in iter_images(args.nude)] +\
+        [(fname, False) for fname in iter_images(args.safe)]
+    if not labeled:
+        parser.error("no images given, use --nude and --safe")
+
+    start = time.perf_counter()
+    options = {"classifiers": sorted(set(args.classifier or ("ycbcr",))),
+               "connectivity": args.connectivity, "resize": args.resize, "floor": args.floor}
+    items = collect(labeled, options, args.jobs, args.summaries)
+    parsed = time.perf_counter()
+
+    grid = dict((name, getattr(args, name)) for name, option in GRID_OPTIONS)
+    rows = sweep(items, grid, args.jobs)
+    index = ('precision', 'recall', 'f1').index(args.sort)
+    rows.sort(key=lambda row: metrics(*row[1:])[index], reverse=True)
+    done = time.perf_counter()
+
+    print("{} images ({} nude), {} settings; parsing {:.2f}s, sweep {:.2f}s".format(
+        len(items), sum(1 for label, summary in items if label), len(rows), parsed - start,
+        done - parsed))
+    header = "{:>8} {:>8} {:>8} {:>8} {:>8}  {:>9} {:>9} {:>9}  {:>5} {:>5} {:>5} {:>5}".format(
+        "min_size", "min_reg", "skin%", "largest%", "max_reg", "precision", "recall", "f1",
+        "tp", "fp", "fn", "tn")
+    print(header)
+    for row in rows[:args.top]:
+        print("{:>8} {:>8} {:>8} {:>8} {:>8}  {:>9.4f} {:>9.4f} {:>9.4f}  {:>5} {:>5} {:>5} {:>5}".format(
+            *(tuple(row[0]) + metrics(*row[1:]) + row[1:])))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(",".join(Thresholds._fields + ("precision", "recall", "f1", "tp", "fp", "fn", "tn")))
+            f.write("\n")
+            for row in rows:
+                f.write(",".join(str(x) for x in tuple(row[0]) + metrics(*row[1:]) + row[1:]))
+                f.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+# 正确性自检
+# 1.连通区域标记：在随机生成的斑块图像上，用逐像素判定和广度优先的洪水填充得到参考的皮肤区域，
+#   与 RegionLabeler 在普通、streaming、early_exit 三种模式和 4/8 连通下的区域大小、外接矩形和区域号比较
+# 2.肤色判定：比较向量化的 skin_mask 与逐像素的 _classify_skin 在各种颜色上的结果，--exhaustive 时检查全部 2^24 种颜色
+# 3.安装了 numpy 时，区域标记同时在有 numpy 和没有 numpy 两条路径上检查，其中也包括 CMYK 图像
+
+# 只依赖标准库和 PIL（肤色判定的比较需要 numpy），任何不一致都会打印出来并以非零状态退出
+
+import sys
+import random
+from collections import deque
+from PIL import Image, ImageDraw
+
+import Nude_jpg
+from Nude_jpg import Nude
+
+# 斑块图像中使用的肤色和非肤色，分别满足和不满足 YCbCr 肤色判定
+SKIN_COLORS = ((220, 170, 140), (200, 150, 120), (235, 190, 160))
+OTHER_COLORS = ((40, 90, 200), (20, 20, 20), (120, 200, 90))
+
+# 随机颜色抽样时，除随机颜色外还检查的网格步长（包含 0 和 255 附近的边界值）
+GRID_STEP = 5
+
+# 精确比较时每次判定的颜色数
+CHUNK = 1 << 20
+
+
+def make_blobs(width, height, seed):
+    """生成随机斑块图像：大小不一的肤色椭圆、矩形和孤立像素，互相重叠、相邻或对角相接"""
+    rng = random.Random(seed)
+    image = Image.new("RGB", (width, height), rng.choice(OTHER_COLORS))
+    draw = ImageDraw.Draw(image)
+    for _ in range(rng.randint(3, 40)):
+        x, y = rng.randrange(width), rng.randrange(height)
+        w, h = rng.randint(1, width // 3 + 1), rng.randint(1, height // 3 + 1)
+        color = rng.choice(SKIN_COLORS if rng.random() < 0.7 else OTHER_COLORS)
+        if rng.random() < 0.5:
+            draw.ellipse((x, y, x + w, y + h), fill=color)
+        else:
+            draw.rectangle((x, y, x + w, y + h), fill=color)
+    # 散落的单个像素和对角相接的像素对，用来区分 4 连通与 8 连通
+    for _ in range(rng.randint(0, width * height // 50)):
+        x, y = rng.randrange(width - 1), rng.randrange(height - 1)
+        color = rng.choice(SKIN_COLORS)
+        image.putpixel((x, y), color)
+        if rng.random() < 0.5:
+            image.putpixel((x + 1, y + 1), color)
+    return image
+
+
+def reference_regions(image, connectivity):
+    """
+    逐像素判定后用洪水填充得到参考结果
+    返回 (每个像素的参考区域号列表，非肤色为 -1, [(像素数, 外接矩形)]，区域按首个像素的扫描顺序编号)
+    """
+    checker = Nude(image)
+    width, height = image.size
+    data = image.convert("RGB").tobytes()
+    skin = [checker._classify_skin(data[i], data[i + 1], data[i + 2]) for i in range(0, len(data), 3)]
+    if connectivity == 8:
+        steps = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+    else:
+        steps = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+    labels = [-1] * (width * height)
+    regions = []
+    for start in range(width * height):
+        if not skin[start] or labels[start] != -1:
+            continue
+        label = len(regions)
+        labels[start] = label
+        queue = deque([start])
+        size, box = 0, [width, height, 0, 0]
+        while queue:
+            index = queue.popleft()
+            x, y = index % width, index // width
+            size += 1
+            box = [min(box[0], x), min(box[1], y), max(box[2], x + 1), max(box[3], y + 1)]
+            for dx, dy in steps:
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < width and 0 <= ny < height:
+                    neighbour = ny * width + nx
+                    if skin[neighbour] and labels[neighbour] == -1:
+                        labels[neighbour] = label
+                        queue.append(neighbour)
+        regions.append((size, tuple(box)))
+    return labels, regions
+
+
+def check_labels(labels, ref_labels):
+    # 两种编号必须是同一个划分：参考区域号与区域号一一对应
+    forward, backward = {}, {}
+    for label, ref in zip(labels, ref_labels):
+        if (label == -1) != (ref == -1):
+            return False
+        if ref != -1 and (forward.setdefault(ref, label) != label or backward.setdefault(label, ref) != ref):
+            return False
+    return True
+
+
+def check_image(image, name, connectivity):
+    """在一张图像上比较各种模式的区域标记与参考结果，返回不一致的说明列表"""
+    ref_labels, ref = reference_regions(image, connectivity)
+    errors = []
+
+    def fail(mode, what):
+        errors.append("{} connectivity={} {}: {}".format(name, connectivity, mode, what))
+
+    n = Nude(image, connectivity=connectivity).parse()
+    got = sorted(zip(n.region_sizes, [tuple(box) for box in n.region_boxes]))
+    if got != sorted(ref):
+        fail("parse", "regions {} != reference {}".format(got, sorted(ref)))
+    elif not check_labels(list(n.labels), ref_labels):
+        fail("parse", "label map does not match the reference partition")
+
+    # streaming 只保留像素数大于 min_region_size 的区域
+    kept = sorted(region for region in ref if region[0] > n.min_region_size)
+    s = Nude(image, connectivity=connectivity).parse(streaming=True)
+    got = sorted(zip(s.region_sizes, [tuple(box) for box in s.region_boxes]))
+    if got != kept:
+        fail("streaming", "regions {} != reference {}".format(got, kept))
+    if (s.result, s.message) != (n.result, n.message):
+        fail("streaming", "verdict {!r} != {!r}".format((s.result, s.message), (n.result, n.message)))
+
+    # 提前结束时判定结果必须与完整解析相同，扫描完整幅图像时区域也必须相同
+    for streaming in (False, True):
+        e = Nude(image, connectivity=connectivity).parse(streaming=streaming, early_exit=True)
+        mode = "early_exit" + (" streaming" if streaming else "")
+        if e.result != n.result:
+            fail(mode, "result {} != {}".format(e.result, n.result))
+        if e.stopped_row is None and sorted(e.skin_regions) != sorted(n.skin_regions):
+            fail(mode, "regions {} != {}".format(sorted(e.skin_regions), sorted(n.skin_regions)))
+    return errors
+
+
+def check_regions(images, seed):
+    """检查 images 张随机斑块图像，返回不一致的说明列表"""
+    rng = random.Random(seed)
+    errors = []
+    for index in range(images):
+        width, height = rng.randint(2, 120), rng.randint(2, 90)
+        image = make_blobs(width, height, rng.random())
+        name = "blobs#{} {}x{}".format(index, width, height)
+        for connectivity in (4, 8):
+            errors.extend(check_image(image, name, connectivity))
+        # 其他模式的图像应当与转换为 RGB 后的结果相同，并且与是否安装 numpy 无关
+        errors.extend(check_image(image.convert("CMYK"), name + " CMYK", 8))
+    return errors
+
+
+def check_mask(classifiers, samples, seed, exhaustive=False):
+    """
+    比较 skin_mask 与 _classify_skin 的逐颜色结果，返回不一致的说明列表
+    exhaustive 为 True 时检查全部 2^24 种颜色（逐像素判定较慢，每种规则需要几分钟）
+    """
+    np = Nude_jpg.np
+    checker = Nude(Image.new("RGB", (1, 1)), classifiers=classifiers)
+    if exhaustive:
+        chunks = (np.arange(start, start + CHUNK, dtype=np.uint32) for start in range(0, 1 << 24, CHUNK))
+    else:
+        rng = np.random.RandomState(seed)
+        grid = np.arange(0, 256, GRID_STEP, dtype=np.uint32)
+        grid = np.unique(np.concatenate([grid, [1, 254, 255]]))
+        r, g, b = np.meshgrid(grid, grid, grid, indexing="ij")
+        grid = (r << 16 | g << 8 | b).ravel()
+        chunks = [np.concatenate([grid, rng.randint(0, 1 << 24, samples).astype(np.uint32)])]
+    errors = []
+    for index in chunks:
+        rgb = np.stack([index >> 16, (index >> 8) & 255, index & 255], axis=-1).astype(np.uint8)
+        mask = checker._skin_mask(rgb[None])[0].tolist()
+        for color, vector in zip(rgb.tolist(), mask):
+            if checker._classify_skin(*color) != vector:
+                errors.append("{} colour {}: skin_mask {} != _classify_skin {}".format(
+                    "+".join(classifiers), tuple(color), vector, not vector))
+    return errors
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Check the region labeler and the vectorized skin '
+                                     'mask against simple reference implementations')
+    parser.add_argument('--images', type=int, default=40, help='Random blob images to label (default: 40)')
+    parser.add_argument('--samples', type=int, default=200000,
+                        help='Random colours per classifier besides the grid (default: 200000)')
+    parser.add_argument('--exhaustive', action='store_true', help='Check all 2^24 colours '
+                        '(several minutes per classifier)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    args = parser.parse_args()
+
+    errors = []
+    # 先走 numpy 路径，再临时去掉 numpy 走纯 Python 路径
+    paths = [("numpy", Nude_jpg.np), ("python", None)] if Nude_jpg.np is not None else [("python", None)]
+    numpy = Nude_jpg.np
+    try:
+        for name, module in paths:
+            Nude_jpg.np = module
+            found = check_regions(args.images, args.seed)
+            print("regions ({}): {} images, {} mismatches".format(name, args.images, len(found)))
+            errors.extend(found)
+    finally:
+        Nude_jpg.np = numpy
+
+    if numpy is None:
+        print("skin mask: skipped, numpy is not installed")
+    else:
+        for name in Nude.CLASSIFIERS:
+            found = check_mask((name,), args.samples, args.seed, args.exhaustive)
+            print("skin mask ({}): {} mismatches".format(name, len(found)))
+            errors.extend(found)
+
+    for error in errors[:50]:
+        print("MISMATCH " + error)
+    if len(errors) > 50:
+        print("... {} more".format(len(errors) - 50))
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())